@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+"""
+Column-level codecs for the cell IDs used across the pipeline.
+
+Xenium cell IDs ("ffkpbaba-1") store a uint32 as eight letters 'a'-'p' (one hex digit
+each) followed by a dataset suffix. encode_xenium_ids / decode_xenium_ids convert whole
+arrays of them to and from (uint32, suffix) pairs through numpy byte views and lookup
+tables, without a Python loop per ID. The Explorer export writes cell_id as
+(cell index, 1) pairs and decodes them with decode_xenium_ids to store the string ID
+Explorer shows for every row of the count matrix.
+
+Baysor cell IDs ("PREFIX-123") are handled on Arrow string columns: cell_id_suffix,
+cell_id_numbers and cell_id_prefix are shared by the tile merge and the reconciliation.
+"""
+
+import re
+from typing import Iterable, Tuple
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+XENIUM_PREFIX_LENGTH = 8
+XENIUM_ALPHABET = b'abcdefghijklmnop'
+INVALID = 255
+
+# Byte -> value lookup tables (INVALID for bytes outside the alphabet)
+NIBBLE_TABLE = np.full(256, INVALID, dtype=np.uint8)
+NIBBLE_TABLE[np.frombuffer(XENIUM_ALPHABET, dtype=np.uint8)] = np.arange(16, dtype=np.uint8)
+DIGIT_TABLE = np.full(256, INVALID, dtype=np.uint8)
+DIGIT_TABLE[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(10, dtype=np.uint8)
+
+
+def encode_xenium_ids(cell_ids: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encode Xenium string cell IDs as (uint32, dataset suffix) pairs.
+
+    The IDs are viewed as a (n, width) uint8 matrix; the letters before the dash are mapped
+    to hex digits with a lookup table and the digits after it to decimal digits, and both
+    are accumulated one character column at a time for all IDs at once.
+
+    Args:
+        cell_ids: Cell IDs such as "ffkpbaba-1"
+
+    Returns:
+        tuple: (uint32 array of the encoded prefixes, int64 array of the dataset suffixes)
+
+    Raises:
+        ValueError: if an ID does not have exactly one dash, a prefix of 1-8 letters 'a'-'p'
+            and a numeric suffix
+    """
+    raw = np.asarray(cell_ids)
+    if raw.dtype.kind == 'O':
+        raw = raw.astype(str)
+    raw = raw.astype(np.bytes_)
+    n = len(raw)
+    if n == 0:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64)
+
+    chars = raw.view(np.uint8).reshape(n, raw.dtype.itemsize)
+    dash = chars == ord('-')
+    if np.any(dash.sum(axis=1) != 1):
+        raise ValueError("Every cell ID needs exactly one '-' between its prefix and suffix")
+
+    column = np.arange(chars.shape[1])
+    split = dash.argmax(axis=1)[:, None]
+    length = np.count_nonzero(chars, axis=1)[:, None]
+    in_prefix = column < split
+    in_suffix = (column > split) & (column < length)
+    if np.any(split[:, 0] == 0) or np.any(split[:, 0] > XENIUM_PREFIX_LENGTH) or np.any(length[:, 0] == split[:, 0] + 1):
+        raise ValueError(f"Cell ID prefixes need 1-{XENIUM_PREFIX_LENGTH} letters and a non-empty suffix")
+
+    nibbles = NIBBLE_TABLE[chars]
+    digits = DIGIT_TABLE[chars]
+    if np.any(in_prefix & (nibbles == INVALID)) or np.any(in_suffix & (digits == INVALID)):
+        raise ValueError("Cell ID prefixes must use the letters 'a'-'p' and suffixes must be numeric")
+
+    # Horner's rule over the character columns: base 16 in the prefix, base 10 in the suffix
+    prefixes = np.zeros(n, dtype=np.uint32)
+    for j in column[:XENIUM_PREFIX_LENGTH]:
+        prefixes = np.where(in_prefix[:, j], (prefixes << np.uint32(4)) | nibbles[:, j], prefixes)
+    suffixes = np.zeros(n, dtype=np.int64)
+    for j in column[2:]:
+        suffixes = np.where(in_suffix[:, j], suffixes * 10 + digits[:, j], suffixes)
+    return prefixes, suffixes
+
+
+def decode_xenium_ids(prefixes: np.ndarray, suffixes: np.ndarray) -> np.ndarray:
+    """
+    Decode (uint32, dataset suffix) pairs to Xenium string cell IDs.
+
+    Every prefix is written with eight letters, so decode_xenium_ids(*encode_xenium_ids(ids))
+    returns `ids` for IDs in the canonical eight-letter form.
+
+    Args:
+        prefixes: uint32 encoded prefixes
+        suffixes: Dataset suffixes
+
+    Returns:
+        np.ndarray: Unicode array of cell IDs
+    """
+    prefixes = np.asarray(prefixes, dtype=np.uint32)
+    shifts = np.arange(4 * (XENIUM_PREFIX_LENGTH - 1), -1, -4, dtype=np.uint32)
+    nibbles = (prefixes[:, None] >> shifts) & np.uint32(0xF)
+    alphabet = np.frombuffer(XENIUM_ALPHABET, dtype=np.uint8)
+    letters = np.ascontiguousarray(alphabet[nibbles]).view(f'S{XENIUM_PREFIX_LENGTH}')[:, 0]
+    return np.char.add(np.char.add(letters.astype(str), '-'), np.asarray(suffixes).astype(np.int64).astype(str))
+
+
+def cell_id_suffix(cells: pa.Array) -> pa.Array:
+    """ID after the last dash of every value (the whole value if there is no dash)."""
+    return pc.replace_substring_regex(cells, pattern='^.*-', replacement='')
+
+
+def cell_id_numbers(cells: pa.Array, assigned: pa.Array) -> pa.Array:
+    """
+    Numeric ID of every assigned "PREFIX-<n>" cell value.
+
+    Args:
+        cells: Arrow string array of cell values
+        assigned: Boolean mask of the values that hold a cell
+
+    Returns:
+        pa.Array: int64 IDs, null for unassigned values and non-numeric suffixes
+    """
+    suffix = cell_id_suffix(cells)
+    numeric = pc.and_(assigned, pc.match_substring_regex(suffix, '^[0-9]+$'))
+    return pc.if_else(numeric, pc.cast(pc.if_else(numeric, suffix, '0'), pa.int64()),
+                      pa.scalar(None, pa.int64()))
+
+
+def cell_id_prefix(cell_value: str) -> str:
+    """Prefix of a "PREFIX-<n>" cell value (the value without its numeric suffix)."""
+    return re.sub(r'-[0-9]*$', '', cell_value)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+"""
+CSV serialization of Arrow blocks shared by the transcript filter and the Baysor tile merge
+and reconciliation.
+
+Blocks are written without a header, so a file can be built from many blocks (written
+in order or serialized in parallel) after a single header line.
+"""
+
+import io
+import pyarrow as pa
+import pyarrow.csv as pcsv
+
+
+def serialize_block(table):
+    """
+    Serialize a table or record batch to CSV bytes (no header).
+
+    Values are written unquoted like csv.writer's minimal quoting; a block that
+    contains a value needing quotes falls back to quoting its strings.
+    """
+    sink = io.BytesIO()
+    try:
+        pcsv.write_csv(table, sink, pcsv.WriteOptions(include_header=False, quoting_style='none'))
+    except pa.ArrowInvalid:
+        sink = io.BytesIO()
+        pcsv.write_csv(table, sink, pcsv.WriteOptions(include_header=False, quoting_style='needed'))
+    return sink.getvalue()
@@ -4,62 +4,193 @@ Detect the maximum token ID from transcripts.parquet in a Xenium bundle.
 Outputs the recommended num_tx_tokens value.
 """
 
+import os
 import sys
+import json
+import hashlib
 import argparse
-import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from pathlib import Path
 
-def detect_max_token_id(base_dir):
+TOKEN_COLUMN = 'feature_name_id'
+GENE_COLUMN = 'feature_name'
+SCAN_BATCH_SIZE = 4_000_000
+CACHE_SUFFIX = '.num_tokens.json'
+
+def find_transcripts_file(base_dir):
     """
-    Scan Xenium bundle for maximum feature_name_id value in transcripts.parquet.
+    Locate transcripts.parquet in a Xenium bundle (or its outs subdirectory).
+    
+    Returns:
+        Path: Path to transcripts.parquet, or None if it does not exist
+    """
+    base_path = Path(base_dir)
+    for transcripts_file in (base_path / "transcripts.parquet", base_path / "outs" / "transcripts.parquet"):
+        if transcripts_file.exists():
+            return transcripts_file
+    return None
+
+def cache_key(transcripts_file):
+    """Identify a transcripts file by its resolved path, size and mtime."""
+    st = os.stat(transcripts_file)
+    return {'path': str(Path(transcripts_file).resolve()), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def cache_path(cache_dir, key):
+    """Sidecar for a transcripts file in `cache_dir`, named by a hash of its resolved path."""
+    name = hashlib.sha1(key['path'].encode()).hexdigest()[:16]
+    return Path(cache_dir) / f"{name}{CACHE_SUFFIX}"
+
+def read_cache(cache_file, key):
+    """
+    Return the cached token statistics if the sidecar matches the file's key, else None.
+    """
+    try:
+        with open(cache_file, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('key') != key:
+        return None
+    return cached.get('stats')
+
+def write_cache(cache_file, key, stats):
+    """Write the token statistics sidecar (skipped with a warning if the location is read-only)."""
+    try:
+        os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+        with open(cache_file, 'w') as f:
+            json.dump({'key': key, 'stats': stats}, f, indent=2)
+    except OSError as e:
+        print(f"Warning: Could not write cache {cache_file}: {e}", file=sys.stderr)
+
+def stats_from_footer(parquet_file):
+    """
+    Answer from the Parquet footer: maximum token ID from row-group statistics.
     
     Args:
-        base_dir: Path to Xenium bundle directory
+        parquet_file: Open pyarrow.parquet.ParquetFile
         
     Returns:
-        int: Maximum token ID found
+        dict: Token statistics, or None if any row group lacks min/max statistics
     """
-    base_path = Path(base_dir)
+    metadata = parquet_file.metadata
+    col_idx = metadata.schema.names.index(TOKEN_COLUMN)
+    
+    max_token_id = 0
+    for rg in range(metadata.num_row_groups):
+        stats = metadata.row_group(rg).column(col_idx).statistics
+        if stats is None or not stats.has_min_max:
+            return None
+        max_token_id = max(max_token_id, int(stats.max))
+    
+    return {
+        'source': 'footer',
+        'max_token_id': max_token_id,
+        'total_transcripts': metadata.num_rows,
+        'unique_tokens': None,
+        'unique_genes': None,
+        'token_counts': None
+    }
+
+def stats_from_scan(parquet_file):
+    """
+    Stream the feature_name_id column and compute max, unique count and per-token counts,
+    plus the number of distinct feature_name values when that column exists.
     
-    # Look for transcripts.parquet in the bundle
-    transcripts_file = base_path / "transcripts.parquet"
+    Args:
+        parquet_file: Open pyarrow.parquet.ParquetFile
+        
+    Returns:
+        dict: Token statistics
+    """
+    columns = [TOKEN_COLUMN]
+    if GENE_COLUMN in parquet_file.schema_arrow.names:
+        columns.append(GENE_COLUMN)
+    token_counts = {}
+    genes = set()
+    total_transcripts = 0
+    for batch in parquet_file.iter_batches(batch_size=SCAN_BATCH_SIZE, columns=columns):
+        total_transcripts += batch.num_rows
+        for entry in pc.value_counts(batch.column(TOKEN_COLUMN)).to_pylist():
+            if entry['values'] is not None:
+                token = int(entry['values'])
+                token_counts[token] = token_counts.get(token, 0) + entry['counts']
+        if GENE_COLUMN in columns:
+            genes.update(pc.unique(batch.column(GENE_COLUMN)).drop_null().to_pylist())
     
-    if not transcripts_file.exists():
-        # Try in outs subdirectory (for processed bundles)
-        transcripts_file = base_path / "outs" / "transcripts.parquet"
+    return {
+        'source': 'scan',
+        'max_token_id': max(token_counts) if token_counts else 0,
+        'total_transcripts': total_transcripts,
+        'unique_tokens': len(token_counts),
+        'unique_genes': len(genes) if GENE_COLUMN in columns else None,
+        # JSON object keys are strings
+        'token_counts': {str(token): count for token, count in sorted(token_counts.items())}
+    }
+
+def detect_max_token_id(base_dir, use_cache=True, scan=False, cache_dir='.'):
+    """
+    Find the maximum feature_name_id value in the transcripts.parquet of a Xenium bundle.
+    
+    Footer row-group statistics are used when every row group has them; otherwise
+    the feature_name_id (and feature_name) columns are streamed. Results are cached in a
+    sidecar in `cache_dir`, keyed by the file's path, size and mtime; the bundle itself is
+    never written to.
     
-    if not transcripts_file.exists():
+    Args:
+        base_dir: Path to Xenium bundle directory
+        use_cache: Read and write the sidecar cache (default: True)
+        scan: Always stream the column, ignoring footer statistics (default: False)
+        cache_dir: Directory of the sidecar cache (default: the working directory)
+        
+    Returns:
+        int: Maximum token ID found
+    """
+    transcripts_file = find_transcripts_file(base_dir)
+    
+    if transcripts_file is None:
         print(f"Error: Could not find transcripts.parquet in {base_dir}", file=sys.stderr)
         return 312  # Default for standard Xenium
     
-    max_token_id = 0
-    
     try:
-        print(f"Reading {transcripts_file}", file=sys.stderr)
-        df = pd.read_parquet(transcripts_file)
+        key = cache_key(transcripts_file)
+        cache_file = cache_path(cache_dir, key)
+        stats = read_cache(cache_file, key) if use_cache else None
+        if stats is not None and scan and stats['source'] != 'scan':
+            stats = None
         
-        if 'feature_name_id' in df.columns:
-            max_token_id = df['feature_name_id'].max()
-            unique_tokens = df['feature_name_id'].nunique()
-            print(f"  Found {unique_tokens} unique transcript types", file=sys.stderr)
-            print(f"  Maximum feature_name_id: {max_token_id}", file=sys.stderr)
+        if stats is not None:
+            print(f"Using cached token statistics from {cache_file}", file=sys.stderr)
+        else:
+            print(f"Reading {transcripts_file}", file=sys.stderr)
+            parquet_file = pq.ParquetFile(transcripts_file)
             
-            # Also report some statistics
-            if 'feature_name' in df.columns:
-                total_transcripts = len(df)
-                unique_genes = df['feature_name'].nunique()
-                print(f"  Total transcripts: {total_transcripts:,}", file=sys.stderr)
-                print(f"  Unique gene names: {unique_genes}", file=sys.stderr)
+            if TOKEN_COLUMN not in parquet_file.schema_arrow.names:
+                print(f"Error: {TOKEN_COLUMN} column not found in {transcripts_file}", file=sys.stderr)
+                print(f"Available columns: {', '.join(parquet_file.schema_arrow.names)}", file=sys.stderr)
+                return 312
+            
+            stats = None if scan else stats_from_footer(parquet_file)
+            if stats is None:
+                print(f"  No usable row-group statistics, scanning {TOKEN_COLUMN}", file=sys.stderr)
+                stats = stats_from_scan(parquet_file)
+            if use_cache:
+                write_cache(cache_file, key, stats)
+        
+        if stats['unique_tokens'] is not None:
+            print(f"  Found {stats['unique_tokens']} unique transcript types", file=sys.stderr)
+        print(f"  Maximum {TOKEN_COLUMN}: {stats['max_token_id']}", file=sys.stderr)
+        print(f"  Total transcripts: {stats['total_transcripts']:,}", file=sys.stderr)
+        if stats.get('unique_genes') is not None:
+            print(f"  Unique gene names: {stats['unique_genes']}", file=sys.stderr)
         else:
-            print(f"Error: feature_name_id column not found in {transcripts_file}", file=sys.stderr)
-            print(f"Available columns: {', '.join(df.columns)}", file=sys.stderr)
-            return 312
+            print(f"  Unique gene names: not counted from footer statistics (use --scan)", file=sys.stderr)
             
     except Exception as e:
         print(f"Error reading {transcripts_file}: {e}", file=sys.stderr)
         return 312
     
-    return int(max_token_id)
+    return int(stats['max_token_id'])
 
 def main():
     parser = argparse.ArgumentParser(description='Detect num_tx_tokens for Segger from Xenium bundle')
@@ -68,9 +199,17 @@ def main():
     parser.add_argument('--min-tokens', type=int, default=313, 
                        help='Minimum number of tokens (default: 313 for standard Xenium)')
     parser.add_argument('--quiet', action='store_true', help='Only output the number')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Do not read or write the token statistics sidecar')
+    parser.add_argument('--cache-dir', default='.',
+                       help='Directory for the token statistics sidecar (default: working directory)')
+    parser.add_argument('--scan', action='store_true',
+                       help='Stream the feature_name_id column even if footer statistics exist '
+                            '(adds unique token, gene name and per-token counts)')
     args = parser.parse_args()
     
-    max_token_id = detect_max_token_id(args.base_dir)
+    max_token_id = detect_max_token_id(args.base_dir, use_cache=not args.no_cache, scan=args.scan,
+                                       cache_dir=args.cache_dir)
     
     # Calculate num_tx_tokens with buffer and minimum
     num_tx_tokens = max(int(max_token_id) + args.buffer, args.min_tokens)
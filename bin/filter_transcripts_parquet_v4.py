@@ -3,49 +3,298 @@
 #v2 removes "UnassignedCodeword" transcripts from data
 
 import argparse
+import csv
 import sys
+import pyarrow as pa
 import pyarrow.dataset as ds
 import pyarrow.compute as pc
-import pandas as pd
+import pyarrow.parquet as pq
+from csv_blocks import serialize_block
+
+
+# Batches stream from the scanner to the writers without a pandas copy, so peak memory
+# is roughly BATCH_SIZE rows times the number of batches read ahead
+BATCH_SIZE = 1_000_000
+BATCH_READAHEAD = 2
+DEFAULT_EXCLUDE_PREFIXES = "NegControlProbe_,antisense_,NegControlCodeword_,UnassignedCodeword,BLANK_"
 
 
 def main():
     args = parse_args()
-    dataset = ds.dataset(args.transcript, format="parquet")
-    fname = ds.field("feature_name")
-    # build an Arrow expression combining all your filters
-    expr = (
-        (ds.field("qv") >= args.min_qv) &
-        (ds.field("x_location") >= args.min_x) &
-        (ds.field("x_location") <= args.max_x) &
-        (ds.field("y_location") >= args.min_y) &
-        (ds.field("y_location") <= args.max_y) &
-        ~pc.match_substring_regex(fname, "^NegControlProbe_") &
-        ~pc.match_substring_regex(fname, "^antisense_") &
-        ~pc.match_substring_regex(fname, "^NegControlCodeword_") &
-        ~pc.match_substring_regex(fname, "^UnassignedCodeword") &
-        ~pc.match_substring_regex(fname, "^BLANK_")
+    # feature_name is read dictionary-encoded so control probes are resolved per dictionary entry
+    parquet_format = ds.ParquetFileFormat(read_options=ds.ParquetReadOptions(dictionary_columns=["feature_name"]))
+    dataset = ds.dataset(args.transcript, format=parquet_format)
+
+    if args.splits:
+        partition_tiles(dataset, args)
+    else:
+        filter_tile(dataset, args)
+
+
+def build_filter(min_qv):
+    """Arrow expression for the QV filter shared by every tile."""
+    return ds.field("qv") >= min_qv
+
+
+def drop_controls(batch, prefixes):
+    """
+    Remove control/blank probes from `batch` and decode feature_name to plain strings.
+
+    The prefixes are matched once against the (small) feature_name dictionary and the
+    result is broadcast to the rows through the dictionary indices, instead of running
+    a regex per row.
+    """
+    fname = batch.column("feature_name")
+    if prefixes:
+        excluded = pc.starts_with(fname.dictionary, prefixes[0])
+        for prefix in prefixes[1:]:
+            excluded = pc.or_(excluded, pc.starts_with(fname.dictionary, prefix))
+        batch = batch.filter(pc.invert(pc.take(excluded, fname.indices)))
+
+    columns = [col.dictionary_decode() if name == "feature_name" else col
+               for name, col in zip(batch.schema.names, batch.columns)]
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def bounds_filter(min_x, max_x, min_y, max_y):
+    """Arrow expression keeping transcripts inside [min, max] on both axes."""
+    return (
+        (ds.field("x_location") >= min_x) &
+        (ds.field("x_location") <= max_x) &
+        (ds.field("y_location") >= min_y) &
+        (ds.field("y_location") <= max_y)
+    )
+
+
+def bounds_mask(batch, tile, halo=0.0):
+    """Boolean mask of the rows of `batch` that fall inside `tile` grown by `halo` on every side."""
+    x = batch.column("x_location")
+    y = batch.column("y_location")
+    return pc.and_(
+        pc.and_(pc.greater_equal(x, tile["x_min"] - halo), pc.less_equal(x, tile["x_max"] + halo)),
+        pc.and_(pc.greater_equal(y, tile["y_min"] - halo), pc.less_equal(y, tile["y_max"] + halo))
+    )
+
+
+def batch_overlaps(tile, x_range, y_range, halo=0.0):
+    """Whether `tile` grown by `halo` intersects a batch with the given x/y min_max ranges."""
+    return (x_range['min'] <= tile["x_max"] + halo and x_range['max'] >= tile["x_min"] - halo and
+            y_range['min'] <= tile["y_max"] + halo and y_range['max'] >= tile["y_min"] - halo)
+
+
+def core_mask(batch, tile, outer):
+    """
+    Boolean mask of the rows of `batch` owned by the core of `tile`.
+
+    The core is half-open ([min, max)) so a transcript on an edge shared by two tiles
+    is core in exactly one of them. Edges lying on the outer boundary of the tiling
+    (`outer`, a dict of the overall x_max / y_max) stay closed so nothing is lost there.
+    """
+    x = batch.column("x_location")
+    y = batch.column("y_location")
+    x_upper = pc.less_equal if tile["x_max"] >= outer["x_max"] else pc.less
+    y_upper = pc.less_equal if tile["y_max"] >= outer["y_max"] else pc.less
+    return pc.and_(
+        pc.and_(pc.greater_equal(x, tile["x_min"]), x_upper(x, tile["x_max"])),
+        pc.and_(pc.greater_equal(y, tile["y_min"]), y_upper(y, tile["y_max"]))
+    )
+
+
+def tag_core(batch, tile, outer):
+    """Append an `is_core` column (1 = core, 0 = halo) to `batch`."""
+    is_core = pc.cast(core_mask(batch, tile, outer), pa.int8())
+    return pa.RecordBatch.from_arrays(batch.columns + [is_core], names=batch.schema.names + ["is_core"])
+
+
+def output_schema(schema, halo=0.0):
+    """Schema of the written tiles: cell_id normalized to string, plus is_core with a halo."""
+    fields = [pa.field(f.name, pa.string()) if f.name == 'cell_id'
+              else pa.field(f.name, f.type.value_type) if pa.types.is_dictionary(f.type)
+              else pa.field(f.name, f.type)
+              for f in schema]
+    if halo > 0:
+        fields.append(pa.field('is_core', pa.int8()))
+    return pa.schema(fields)
+
+
+def normalize_cell_id(batch, schema):
+    """Map unassigned cell ids (-1 / UNASSIGNED) to '0' with Arrow kernels and cast to `schema`."""
+    cell_id = batch.column('cell_id')
+    if not pa.types.is_string(cell_id.type):
+        cell_id = pc.cast(cell_id, pa.string())
+    unassigned = pc.is_in(cell_id, value_set=pa.array(['-1', 'UNASSIGNED']))
+    cell_id = pc.if_else(unassigned, '0', cell_id)
+    columns = [cell_id if name == 'cell_id' else batch.column(name) for name in batch.schema.names]
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+class TileWriter:
+    """
+    Writes the batches of one tile as csv, parquet or arrow (IPC file) straight from
+    Arrow, and counts the rows, which are stored in a `<stem>.count` sidecar on close
+    so downstream steps (e.g. the baysor_min_trans gate) don't have to scan the tile.
+
+    CSV rows are written unquoted like the former pandas output; only a batch with a
+    value that needs quotes falls back to quoting (see serialize_block).
+    """
+
+    def __init__(self, stem, schema, fmt='csv', halo=0.0):
+        self.path = f"{stem}.{fmt}"
+        self.count_path = f"{stem}.count"
+        self.schema = output_schema(schema, halo)
+        self.rows = 0
+        self._file = None
+        if fmt == 'csv':
+            self._file = open(self.path, 'wb')
+            self._file.write((','.join(self.schema.names) + '\n').encode())
+            self._writer = None
+        elif fmt == 'parquet':
+            self._writer = pq.ParquetWriter(self.path, self.schema)
+        else:
+            self._file = pa.OSFile(self.path, 'wb')
+            self._writer = pa.ipc.new_file(self._file, self.schema)
+
+    def write(self, batch):
+        self.rows += batch.num_rows
+        batch = normalize_cell_id(batch, self.schema)
+        if self._writer is None:
+            self._file.write(serialize_block(batch))
+        else:
+            self._writer.write_batch(batch)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+        with open(self.count_path, 'w') as f:
+            f.write(f"{self.rows}\n")
+
+
+def filter_tile(dataset, args):
+    """
+    Write the transcripts of a single tile given on the command line.
+
+    With a halo, the tile is grown by -halo on every side and each transcript is tagged
+    core/halo. The upper core edges are half-open unless they lie on the outer boundary of
+    the tiling (-outer_x_max / -outer_y_max, the tile itself when not given), so a transcript
+    on an edge shared with a neighbour is core in exactly one of the two tiles.
+    """
+    tile = {'x_min': args.min_x, 'x_max': args.max_x, 'y_min': args.min_y, 'y_max': args.max_y}
+    outer = {
+        'x_max': args.max_x if args.outer_x_max is None else args.outer_x_max,
+        'y_max': args.max_y if args.outer_y_max is None else args.outer_y_max
+    }
+    expr = build_filter(args.min_qv) & bounds_filter(
+        args.min_x - args.halo, args.max_x + args.halo,
+        args.min_y - args.halo, args.max_y + args.halo
     )
 
     scanner = dataset.scanner(
         filter=expr,
-        batch_size=1_000_000
+        batch_size=BATCH_SIZE,
+        batch_readahead=BATCH_READAHEAD,
+        fragment_readahead=1
     )
 
-    out_csv = f"X{args.min_x}-{args.max_x}_Y{args.min_y}-{args.max_y}_filtered_transcripts.csv"
-    header = True
-    with open(out_csv, 'w', newline='') as f:
+    stem = f"X{args.min_x}-{args.max_x}_Y{args.min_y}-{args.max_y}_filtered_transcripts"
+    writer = TileWriter(stem, scanner.projected_schema, args.format, args.halo)
+    try:
         for batch in scanner.to_batches():
-            df = batch.to_pandas()
-            df['cell_id'] = df['cell_id'].replace({-1: '0', 'UNASSIGNED': '0'})
-            df.to_csv(f, index=False, header=header)
-            header = False
+            batch = drop_controls(batch, args.exclude_prefixes)
+            if args.halo > 0:
+                batch = tag_core(batch, tile, outer)
+            writer.write(batch)
+    finally:
+        writer.close()
+
+
+def read_splits(splits_path):
+    """Read tile definitions (tile_id, x_min, x_max, y_min, y_max) from a splits.csv."""
+    tiles = []
+    with open(splits_path, newline='') as f:
+        for row in csv.DictReader(f, skipinitialspace=True):
+            tiles.append({
+                'tile_id': row['tile_id'].strip(),
+                'x_min': float(row['x_min']),
+                'x_max': float(row['x_max']),
+                'y_min': float(row['y_min']),
+                'y_max': float(row['y_max'])
+            })
+    if not tiles:
+        print(f"Error: No tiles found in {splits_path}", file=sys.stderr)
+        sys.exit(1)
+    return tiles
+
+
+def partition_tiles(dataset, args):
+    """
+    Scan the transcripts once and route every filtered batch to all of its tiles.
+
+    Tiles keep the inclusive [min, max] bounds of the per-tile mode, so a transcript
+    sitting exactly on a shared edge is written to both neighbours as before. With a
+    halo, each tile is grown by -halo and its rows are tagged core/halo (see core_mask).
+    A manifest listing each tile, its file and its transcript count is written last.
+    """
+    tiles = read_splits(args.splits)
+    outer = {'x_max': max(t['x_max'] for t in tiles), 'y_max': max(t['y_max'] for t in tiles)}
+
+    # Restrict the scan to the bounding box of all tiles so row groups outside it can be skipped
+    expr = build_filter(args.min_qv) & bounds_filter(
+        min(t['x_min'] for t in tiles) - args.halo, outer['x_max'] + args.halo,
+        min(t['y_min'] for t in tiles) - args.halo, outer['y_max'] + args.halo
+    )
+
+    scanner = dataset.scanner(
+        filter=expr,
+        batch_size=BATCH_SIZE,
+        batch_readahead=BATCH_READAHEAD,
+        fragment_readahead=1
+    )
+
+    writers = {}
+    try:
+        for tile in tiles:
+            writers[tile['tile_id']] = TileWriter(f"{tile['tile_id']}_filtered_transcripts",
+                                                  scanner.projected_schema, args.format, args.halo)
+
+        for batch in scanner.to_batches():
+            batch = drop_controls(batch, args.exclude_prefixes)
+            if batch.num_rows == 0:
+                continue
+            # On a spatially sorted input (sort_transcripts.py) a batch only touches a few tiles
+            x_range = pc.min_max(batch.column("x_location")).as_py()
+            y_range = pc.min_max(batch.column("y_location")).as_py()
+            for tile in tiles:
+                if not batch_overlaps(tile, x_range, y_range, args.halo):
+                    continue
+                tile_batch = batch.filter(bounds_mask(batch, tile, args.halo))
+                if tile_batch.num_rows == 0:
+                    continue
+                if args.halo > 0:
+                    tile_batch = tag_core(tile_batch, tile, outer)
+                writers[tile['tile_id']].write(tile_batch)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    with open(args.manifest, 'w', newline='') as f:
+        manifest = csv.writer(f)
+        manifest.writerow(['tile_id', 'x_min', 'x_max', 'y_min', 'y_max', 'file', 'n_transcripts'])
+        for tile in tiles:
+            writer = writers[tile['tile_id']]
+            manifest.writerow([tile['tile_id'], tile['x_min'], tile['x_max'], tile['y_min'], tile['y_max'],
+                               writer.path, writer.rows])
+
+    print(f"Partitioned {sum(w.rows for w in writers.values())} transcripts into {len(tiles)} tiles "
+          f"({args.manifest})", file=sys.stderr)
 
 
 def parse_args():
     """Parses command-line options for main()."""
     summary = 'Filter transcripts from transcripts.csv based on Q-Score threshold \
-               and upper bounds on x and y coordinates. Remove negative controls.'
+               and upper bounds on x and y coordinates. Remove negative controls. \
+               With -splits, partition every tile of a splits.csv in a single pass.'
 
     parser = argparse.ArgumentParser(description=summary)
     requiredNamed = parser.add_argument_group('required named arguments')
@@ -81,6 +330,41 @@ def parse_args():
                              "If no limit is specified, the default value will retain all " +
                              "transcripts since Xenium slide is <24000 microns in x and y. " +
                              "(default: 24000.0)")
+    parser.add_argument('-outer_x_max',
+                        default=None,
+                        type=float,
+                        help="Largest x_max of all tiles in the splits. With a halo, only core edges " +
+                             "on this outer boundary are closed. (default: -max_x)")
+    parser.add_argument('-outer_y_max',
+                        default=None,
+                        type=float,
+                        help="Largest y_max of all tiles in the splits. With a halo, only core edges " +
+                             "on this outer boundary are closed. (default: -max_y)")
+    parser.add_argument('-exclude_prefixes',
+                        default=DEFAULT_EXCLUDE_PREFIXES,
+                        type=lambda value: [p for p in value.split(',') if p],
+                        help="Comma-separated feature_name prefixes to drop (control and blank probes). " +
+                             f"(default: {DEFAULT_EXCLUDE_PREFIXES})")
+    parser.add_argument('-halo',
+                        default='0.0',
+                        type=float,
+                        help="Halo margin (microns) added around every tile. Transcripts in the " +
+                             "margin are kept for context and tagged is_core=0. (default: 0.0, no halo)")
+    parser.add_argument('-format',
+                        default='csv',
+                        choices=['csv', 'parquet', 'arrow'],
+                        help="Output format of the tile transcripts. parquet and arrow (IPC file) are " +
+                             "written straight from the Arrow batches. A <tile>.count sidecar with the " +
+                             "row count is always written. (default: csv)")
+    parser.add_argument('-splits',
+                        default=None,
+                        help="Optional splits.csv (tile_id, x_min, x_max, y_min, y_max). When given, " +
+                             "the transcripts are scanned once and written to one " +
+                             "<tile_id>_filtered_transcripts.<format> per tile; -min/max_x/y are ignored.")
+    parser.add_argument('-manifest',
+                        default='tiles_manifest.csv',
+                        help="Manifest of the per-tile outputs written in -splits mode " +
+                             "(default: tiles_manifest.csv)")
 
     try:
         opts = parser.parse_args()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+"""
+Script to merge per-tile Baysor segmentations into a single CSV/polygon GeoParquet pair.
+
+Each tile CSV is parsed once on a process pool: its cell IDs are split into
+(prefix, numeric id), the tile's max cell ID is recorded and the rows are kept
+in a binary Arrow part file. Cell ID offsets are the prefix sum of the per-tile
+max IDs. A second pool pass rewrites every tile as "<canonical prefix>-<id + offset>"
+and the parts are concatenated into merged.csv. The tile polygon GeoParquet files are
+appended to merged_polygons.parquet with the same offsets added to their cell column.
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pcsv
+from cell_id_codec import cell_id_numbers, cell_id_prefix
+from csv_blocks import serialize_block
+from polygon_parquet import CELL_COLUMN, polygon_writer, read_polygons
+from reconcile_segmentation import EMPTY_CELL_VALUES
+
+BLOCK_SIZE = 64 << 20
+CELL_ID_COLUMN = '__cell_id'
+
+
+def read_header(csv_path):
+    """Return the column names of a CSV file (empty list for an empty file)."""
+    with open(csv_path, 'r') as f:
+        line = f.readline().rstrip('\r\n')
+    return line.split(',') if line else []
+
+
+def split_tile(csv_path, part_path, cell_col='cell'):
+    """
+    Parse one tile CSV and store it as an Arrow IPC part with a numeric cell ID column.
+
+    Args:
+        csv_path: Path to the tile segmentation CSV
+        part_path: Path for the Arrow IPC part file
+        cell_col: Name of the cell column (default: 'cell')
+
+    Returns:
+        dict: header, rows, max_id (0 if none) and the prefix of the first assigned cell
+    """
+    header = read_header(csv_path)
+    result = {'header': header, 'rows': 0, 'max_id': 0, 'prefix': None}
+    if cell_col not in header:
+        return result
+
+    reader = pcsv.open_csv(
+        csv_path,
+        read_options=pcsv.ReadOptions(block_size=BLOCK_SIZE),
+        convert_options=pcsv.ConvertOptions(
+            column_types={name: pa.string() for name in header},
+            null_values=[],
+            strings_can_be_null=False,
+            quoted_strings_can_be_null=False
+        )
+    )
+    schema = reader.schema.append(pa.field(CELL_ID_COLUMN, pa.int64()))
+
+    with pa.OSFile(part_path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in reader:
+            cells = batch.column(header.index(cell_col))
+            assigned = pc.invert(pc.is_in(cells, value_set=EMPTY_CELL_VALUES))
+            cell_ids = cell_id_numbers(cells, assigned)
+
+            batch_max = pc.max(cell_ids).as_py()
+            if batch_max is not None:
+                result['max_id'] = max(result['max_id'], batch_max)
+            if result['prefix'] is None:
+                first = cells.filter(assigned).slice(0, 1).to_pylist()
+                if first:
+                    result['prefix'] = cell_id_prefix(first[0])
+
+            result['rows'] += batch.num_rows
+            writer.write_batch(pa.RecordBatch.from_arrays(batch.columns + [cell_ids], schema=schema))
+
+    return result
+
+
+def write_tile_part(part_path, csv_out, offset, prefix, cell_col='cell'):
+    """
+    Rewrite one tile's cells as "<prefix>-<id + offset>".
+
+    Args:
+        part_path: Arrow IPC part produced by split_tile (None for empty tiles)
+        csv_out: Path for the CSV rows (no header)
+        offset: Offset added to the numeric cell IDs
+        prefix: Canonical cell ID prefix
+        cell_col: Name of the cell column (default: 'cell')
+    """
+    with open(csv_out, 'wb') as out:
+        if part_path is not None:
+            with pa.memory_map(part_path) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    cell_ids = batch.column(CELL_ID_COLUMN)
+                    new_cells = pc.binary_join_element_wise(
+                        prefix, pc.cast(pc.add(cell_ids, offset), pa.string()), '-'
+                    )
+                    cell_idx = batch.schema.get_field_index(cell_col)
+                    columns = batch.columns[:-1]
+                    columns[cell_idx] = pc.if_else(pc.is_valid(cell_ids), new_cells, columns[cell_idx])
+                    table = pa.Table.from_arrays(columns, names=batch.schema.names[:-1])
+                    out.write(serialize_block(table))
+
+
+def offset_polygons(polygons_path, offset):
+    """Read a tile polygon GeoParquet with `offset` added to its cell IDs."""
+    polygons = read_polygons(polygons_path)
+    cell_idx = polygons.schema.get_field_index(CELL_COLUMN)
+    return polygons.set_column(cell_idx, CELL_COLUMN, pc.add(polygons.column(cell_idx), offset))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Merge per-tile Baysor segmentation CSV/polygon files with offset cell IDs'
+    )
+    parser.add_argument(
+        '--csv',
+        nargs='+',
+        required=True,
+        help='Tile segmentation CSV files'
+    )
+    parser.add_argument(
+        '--polygons',
+        nargs='+',
+        required=True,
+        help='Tile polygon GeoParquet files, in the same order as --csv'
+    )
+    parser.add_argument(
+        '--out-csv',
+        default='merged.csv',
+        help='Path for the merged CSV (default: merged.csv)'
+    )
+    parser.add_argument(
+        '--out-polygons',
+        default='merged_polygons.parquet',
+        help='Path for the merged polygon GeoParquet (default: merged_polygons.parquet)'
+    )
+    parser.add_argument(
+        '--cell-column',
+        default='cell',
+        help='Name of the cell column in CSV (default: cell)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of tiles processed concurrently (default: 1)'
+    )
+
+    args = parser.parse_args()
+
+    if len(args.csv) != len(args.polygons):
+        print("Error: --csv and --polygons must list the same number of files", file=sys.stderr)
+        sys.exit(1)
+
+    tmpdir = tempfile.mkdtemp(prefix='merge_tiles_', dir='.')
+    n_tiles = len(args.csv)
+    parts = [os.path.join(tmpdir, f"tile_{i}.arrow") for i in range(n_tiles)]
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            # Pass 1: parse every tile CSV once
+            tiles = list(pool.map(split_tile, args.csv, parts, [args.cell_column] * n_tiles))
+
+            # Skipped tiles (header only) carry Baysor's placeholder header, so take the header from a tile with rows
+            header = next((t['header'] for t in tiles if t['rows'] > 0), None)
+            if header is None:
+                print("Warning: No transcript rows in any tile", file=sys.stderr)
+                header = next((t['header'] for t in tiles if t['header']), [])
+            for csv_path, tile in zip(args.csv, tiles):
+                if tile['rows'] > 0 and tile['header'] != header:
+                    print(f"Error: {csv_path} has different columns than the other tiles", file=sys.stderr)
+                    sys.exit(1)
+
+            # This ensures all cells have the same prefix (required by Xenium Ranger)
+            prefix = next((t['prefix'] for t in tiles if t['prefix'] is not None), None)
+            if prefix is None and any(t['max_id'] for t in tiles):
+                print("Error: Could not extract cell ID prefix from any tile", file=sys.stderr)
+                sys.exit(1)
+            print(f"Using canonical cell ID prefix: {prefix}", file=sys.stderr)
+
+            # Offsets are the prefix sum of the per-tile max cell IDs
+            offsets = []
+            offset = 0
+            for i, tile in enumerate(tiles):
+                offsets.append(offset)
+                print(f"Tile {i}: {args.csv[i]} ({tile['rows']} rows, max cell ID {tile['max_id']}) "
+                      f"offset {offset}", file=sys.stderr)
+                offset += tile['max_id']
+
+            # Pass 2: rewrite tiles with their offsets
+            csv_parts = [os.path.join(tmpdir, f"tile_{i}.csv") for i in range(n_tiles)]
+            list(pool.map(
+                write_tile_part,
+                [part if tile['rows'] > 0 else None for part, tile in zip(parts, tiles)],
+                csv_parts, offsets,
+                [prefix or ''] * n_tiles, [args.cell_column] * n_tiles
+            ))
+
+        # Concatenate the parts in tile order
+        with open(args.out_csv, 'wb') as out:
+            out.write((','.join(header) + '\n').encode())
+            for part in csv_parts:
+                with open(part, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+
+        # Polygons only need their cell column offset, so they are appended without an intermediate part
+        writer = polygon_writer(args.out_polygons)
+        try:
+            for polygons_path, offset in zip(args.polygons, offsets):
+                writer.write_table(offset_polygons(polygons_path, offset))
+        finally:
+            writer.close()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print(f"Merged {n_tiles} tiles into {args.out_csv} and {args.out_polygons}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+
+"""
+Columnar polygon format used between BAYSOR_RUN and IMPORT_SEGMENTATION.
+
+Baysor writes its cell polygons as a GeometryCollection JSON. Right after Baysor the
+tile JSON is parsed once into a GeoParquet file with a `cell` column (int64 numeric
+cell ID) and a `geometry` column in the GeoArrow native polygon encoding
+(list of rings, each a list of x/y structs). The halo trim, the tile merge and the
+reconciliation read and write this file with Arrow (memory-mapped, no JSON parsing),
+and the GeometryCollection JSON expected by xeniumranger import-segmentation is only
+written at the very end, with Arrow string kernels instead of json.dumps.
+
+Usage:
+    polygon_parquet.py tile_polygons_2d.json tile_polygons.parquet   (JSON -> GeoParquet)
+    polygon_parquet.py filtered_polygons.parquet viz_polygons.json   (GeoParquet -> JSON)
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+CHUNK_SIZE = 1 << 20
+JSON_BATCH_ROWS = 65_536
+CELL_COLUMN = 'cell'
+GEOMETRY_COLUMN = 'geometry'
+POINT_TYPE = pa.struct([('x', pa.float64()), ('y', pa.float64())])
+POLYGON_TYPE = pa.list_(pa.field('element', pa.list_(pa.field('element', POINT_TYPE))))
+GEO_METADATA = {
+    'version': '1.1.0',
+    'primary_column': GEOMETRY_COLUMN,
+    'columns': {
+        GEOMETRY_COLUMN: {'encoding': 'polygon', 'geometry_types': ['Polygon'], 'crs': None}
+    }
+}
+POLYGON_SCHEMA = pa.schema(
+    [(CELL_COLUMN, pa.int64()), (GEOMETRY_COLUMN, POLYGON_TYPE)],
+    metadata={b'geo': json.dumps(GEO_METADATA).encode()}
+)
+
+
+class MissingGeometries(Exception):
+    """Raised when the JSON document has no top-level 'geometries' array."""
+
+
+def iter_geometries(f, chunk_size=CHUNK_SIZE):
+    """
+    Incrementally yield the objects of the 'geometries' array of a GeometryCollection.
+
+    The file is read in chunks and each geometry is decoded with JSONDecoder.raw_decode,
+    so only one geometry (plus a chunk of text) is held in memory at a time.
+
+    Raises:
+        MissingGeometries: if there is no 'geometries' key
+        json.JSONDecodeError: if the content is malformed or truncated
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+        # drop consumed text so the buffer stays around one chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    def expect(chars):
+        nonlocal pos
+        skip_ws()
+        if pos >= len(buf) or buf[pos] not in chars:
+            found = buf[pos] if pos < len(buf) else 'end of file'
+            raise json.JSONDecodeError(f"Expected one of {chars!r}, found {found!r}", buf, pos)
+        pos += 1
+        return buf[pos - 1]
+
+    # Locate the start of the geometries array
+    while True:
+        key = buf.find('"geometries"', pos)
+        if key >= 0:
+            pos = key + len('"geometries"')
+            break
+        if eof:
+            raise MissingGeometries()
+        # keep a tail in case the key straddles two chunks
+        pos = max(pos, len(buf) - len('"geometries"'))
+        fill()
+    expect(':')
+    expect('[')
+
+    skip_ws()
+    if pos < len(buf) and buf[pos] == ']':
+        return
+
+    while True:
+        skip_ws()
+        while True:
+            try:
+                geometry, end = decoder.raw_decode(buf, pos)
+                break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+        pos = end
+        yield geometry
+        if expect(',]') == ']':
+            return
+
+
+def list_offsets(lengths):
+    """int32 list offsets (0, cumulative lengths) for ListArray.from_arrays."""
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    return pa.array(offsets)
+
+
+def polygons_from_geometries(geometries):
+    """
+    Build a polygon table from GeometryCollection geometries.
+
+    Args:
+        geometries: Iterable of GeoJSON Polygon dicts with a "cell" member
+
+    Returns:
+        pa.Table: Table with POLYGON_SCHEMA, one row per geometry. Cells that are not
+        integers are stored as null.
+
+    Raises:
+        ValueError: if a geometry is not a Polygon
+    """
+    cells = []
+    polygon_rings = []
+    ring_vertices = []
+    coordinates = []
+    for geometry in geometries:
+        if geometry.get('type') != 'Polygon':
+            raise ValueError(f"Expected Polygon geometries, found {geometry.get('type')!r}")
+        cell = geometry.get('cell')
+        if cell is not None:
+            try:
+                cell = int(cell)
+            except (ValueError, TypeError):
+                print(f"Warning: Could not convert cell ID {cell} to integer", file=sys.stderr)
+                cell = None
+        cells.append(cell)
+        rings = geometry.get('coordinates') or []
+        polygon_rings.append(len(rings))
+        for ring in rings:
+            ring_vertices.append(len(ring))
+            coordinates.extend(ring)
+
+    xy = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    points = pa.StructArray.from_arrays([pa.array(xy[:, 0]), pa.array(xy[:, 1])], fields=list(POINT_TYPE))
+    rings = pa.ListArray.from_arrays(list_offsets(ring_vertices), points, type=POLYGON_TYPE.value_type)
+    polygons = pa.ListArray.from_arrays(list_offsets(polygon_rings), rings, type=POLYGON_TYPE)
+    return pa.Table.from_arrays([pa.array(cells, type=pa.int64()), polygons], schema=POLYGON_SCHEMA)
+
+
+def read_geojson(json_path):
+    """
+    Parse a Baysor GeometryCollection JSON into a polygon table.
+
+    Empty, whitespace-only and malformed files (e.g. tiles Baysor skipped) give an empty table.
+
+    Args:
+        json_path: Path to the polygons JSON
+
+    Returns:
+        pa.Table: Table with POLYGON_SCHEMA
+    """
+    if not os.path.exists(json_path):
+        raise FileNotFoundError(f"Input file {json_path} not found")
+    if os.path.getsize(json_path) == 0:
+        print(f"Info: Input file {json_path} is empty", file=sys.stderr)
+        return POLYGON_SCHEMA.empty_table()
+
+    try:
+        with open(json_path, 'r') as f:
+            table = polygons_from_geometries(iter_geometries(f))
+    except MissingGeometries:
+        with open(json_path, 'r') as f:
+            whitespace_only = not f.read(CHUNK_SIZE).strip()
+        if whitespace_only:
+            print(f"Info: Input file {json_path} contains only whitespace", file=sys.stderr)
+        else:
+            print(f"Warning: No 'geometries' key found in {json_path}", file=sys.stderr)
+        return POLYGON_SCHEMA.empty_table()
+    except json.JSONDecodeError as e:
+        print(f"Error: Failed to parse JSON from {json_path}: {e}", file=sys.stderr)
+        return POLYGON_SCHEMA.empty_table()
+
+    if table.num_rows == 0:
+        print(f"Info: No geometries found in {json_path} (empty array)", file=sys.stderr)
+    return table
+
+
+def read_polygons(path, columns=None):
+    """Memory-map a polygon GeoParquet file (optionally only some of its columns)."""
+    return pq.read_table(path, columns=columns, memory_map=True)
+
+
+def write_polygons(table, path):
+    """Write a polygon table as GeoParquet."""
+    pq.write_table(table.cast(POLYGON_SCHEMA), path)
+
+
+def polygon_writer(path):
+    """ParquetWriter with POLYGON_SCHEMA, for appending several polygon tables to one file."""
+    return pq.ParquetWriter(path, POLYGON_SCHEMA)
+
+
+def wrap_lists(values, lengths, open_text, close_text):
+    """Join `values` into one "<open>v,v,...<close>" string per list of `lengths` values."""
+    joined = pc.binary_join(pa.ListArray.from_arrays(list_offsets(lengths), values), ',')
+    return pc.binary_join_element_wise(open_text, joined, close_text, '')
+
+
+def geojson_geometries(batch):
+    """
+    Serialize the polygons of a batch as GeoJSON Polygon objects (one string per row).
+
+    Coordinates are cast with Arrow's shortest round-trip float formatting, so parsing the
+    text gives back the same float64 values.
+
+    Args:
+        batch: RecordBatch with POLYGON_SCHEMA columns
+
+    Returns:
+        pa.Array: String array of '{"type":"Polygon","coordinates":[...],"cell":<id>}'
+    """
+    polygons = batch.column(GEOMETRY_COLUMN)
+    cells = batch.column(CELL_COLUMN)
+    rings = pc.list_flatten(polygons)
+    points = pc.list_flatten(rings)
+
+    x = pc.cast(pc.struct_field(points, 'x'), pa.string())
+    y = pc.cast(pc.struct_field(points, 'y'), pa.string())
+    vertices = pc.binary_join_element_wise('[', x, ',', y, ']', '')
+    rings_text = wrap_lists(vertices, pc.list_value_length(rings).to_numpy(), '[', ']')
+    coordinates = wrap_lists(rings_text, pc.list_value_length(polygons).to_numpy(),
+                             '{"type":"Polygon","coordinates":[', ']')
+    cell_text = pc.fill_null(pc.cast(cells, pa.string()), 'null')
+    return pc.binary_join_element_wise(coordinates, ',"cell":', cell_text, '}', '')
+
+
+def write_geojson(path, output_path, batch_rows=JSON_BATCH_ROWS):
+    """
+    Write a polygon GeoParquet file as the GeometryCollection JSON read by xeniumranger.
+
+    Args:
+        path: Polygon GeoParquet file
+        output_path: Path for the JSON
+        batch_rows: Polygons serialized per batch
+
+    Returns:
+        int: Number of geometries written
+    """
+    count = 0
+    with open(output_path, 'wb') as out:
+        out.write(b'{"geometries":[')
+        for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=batch_rows):
+            if batch.num_rows == 0:
+                continue
+            text = geojson_geometries(batch)
+            joined = pc.binary_join(pa.ListArray.from_arrays([0, len(text)], text), ',')[0]
+            if count > 0:
+                out.write(b',')
+            out.write(joined.as_buffer())
+            count += batch.num_rows
+        out.write(b'],"type":"GeometryCollection"}')
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert Baysor polygons between GeometryCollection JSON and the pipeline GeoParquet format'
+    )
+    parser.add_argument(
+        'input',
+        help='Polygons JSON (converted to GeoParquet) or polygons .parquet (converted to JSON)'
+    )
+    parser.add_argument(
+        'output',
+        help='Path for the converted polygons'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=JSON_BATCH_ROWS,
+        help=f'Polygons serialized per batch when writing JSON (default: {JSON_BATCH_ROWS})'
+    )
+
+    args = parser.parse_args()
+
+    try:
+        if args.input.endswith('.parquet'):
+            count = write_geojson(args.input, args.output, args.batch_size)
+        else:
+            table = read_geojson(args.input)
+            write_polygons(table, args.output)
+            count = table.num_rows
+    except Exception as e:
+        print(f"Error converting {args.input}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Converted {count} polygons from {args.input} to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+"""
+Script to reconcile a merged segmentation CSV with its polygon GeoParquet in one pass per file.
+
+Transcript rows whose cell has no polygon are removed from the CSV, and polygons whose
+cell has no remaining transcripts are removed from the polygons (Xenium Ranger rejects both).
+Only the cell column of the polygons is read to get the polygon cells. The CSV is then
+streamed once in Arrow blocks, filtered against the polygon cells while the surviving cell
+IDs are collected, and the polygons of those cells are written with one Arrow filter.
+A JSON reconciliation report summarizes what was removed.
+"""
+
+import json
+import sys
+import argparse
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pcsv
+from cell_id_codec import cell_id_suffix
+from csv_blocks import serialize_block
+from polygon_parquet import CELL_COLUMN, read_polygons, write_polygons
+
+BLOCK_SIZE = 64 << 20
+EMPTY_CELL_VALUES = pa.array(['', 'NA', 'null', 'None'])
+REPORT_TOP_CELLS = 10
+
+
+def find_cell_column(header_row, cell_col_name='cell'):
+    """
+    Find the index of the cell column in the CSV header.
+
+    Returns:
+        int: Column index (0-based) or None if not found
+    """
+    try:
+        return header_row.index(cell_col_name)
+    except ValueError:
+        return None
+
+
+def read_polygon_cells(polygons_path):
+    """
+    Read the cell IDs of a polygon GeoParquet (only its cell column is read).
+
+    Args:
+        polygons_path: Path to the merged polygon GeoParquet
+
+    Returns:
+        pa.Array: Cell ID of every polygon as a string (null when it has no cell)
+    """
+    try:
+        cells = read_polygons(polygons_path, columns=[CELL_COLUMN]).column(CELL_COLUMN)
+    except Exception as e:
+        print(f"Error reading polygons file: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    return pc.cast(cells.combine_chunks(), pa.string())
+
+
+def filter_csv(csv_path, polygon_cells, output_path, cell_col_name='cell', threads=4):
+    """
+    Remove transcript rows whose cell has no polygon and collect the cells that remain.
+
+    The CSV is streamed in blocks with Arrow's reader (every column kept as text).
+    For each block the cell ID suffix is extracted with Arrow compute, rows are
+    masked with is_in against the polygon cell set, and the kept rows are serialized
+    on a thread pool and written in order.
+
+    Args:
+        csv_path: Path to input CSV file
+        polygon_cells: Set of cell IDs (strings) that have a polygon
+        output_path: Path to output validated CSV file
+        cell_col_name: Name of the cell column (default: 'cell')
+        threads: Number of threads used to serialize blocks (default: 4)
+
+    Returns:
+        dict: row counts, the set of cell IDs with kept transcripts, a sample of
+        orphaned cell values and transcript counts per orphaned cell
+    """
+    stats = {
+        'rows': 0,
+        'kept': 0,
+        'removed': 0,
+        'unassigned': 0,
+        'cells': set(),
+        'orphaned_sample': [],
+        'orphaned_counts': defaultdict(int)
+    }
+
+    try:
+        with open(csv_path, 'r') as infile:
+            header = infile.readline().rstrip('\r\n').split(',')
+
+        # Find cell column index
+        cell_col_idx = find_cell_column(header, cell_col_name)
+        if cell_col_idx is None:
+            print(f"Error: Could not find '{cell_col_name}' column in CSV header", file=sys.stderr)
+            print(f"Available columns: {', '.join(header)}", file=sys.stderr)
+            sys.exit(1)
+
+        # Read every column as text so kept rows are written back unchanged
+        reader = pcsv.open_csv(
+            csv_path,
+            read_options=pcsv.ReadOptions(block_size=BLOCK_SIZE),
+            convert_options=pcsv.ConvertOptions(
+                column_types={name: pa.string() for name in header},
+                null_values=[],
+                strings_can_be_null=False,
+                quoted_strings_can_be_null=False
+            )
+        )
+        value_set = pa.array(sorted(polygon_cells), type=pa.string())
+
+        with open(output_path, 'wb') as outfile, ThreadPoolExecutor(max_workers=threads) as pool:
+            outfile.write((','.join(header) + '\n').encode())
+
+            pending = deque()
+            for batch in reader:
+                stats['rows'] += batch.num_rows
+                cells = batch.column(cell_col_idx)
+
+                # No cell assignment - keep the row (unassigned transcript)
+                unassigned = pc.is_in(cells, value_set=EMPTY_CELL_VALUES)
+                cell_ids = cell_id_suffix(cells)
+                has_polygon = pc.and_(pc.invert(unassigned), pc.is_in(cell_ids, value_set=value_set))
+                keep = pc.or_(unassigned, has_polygon)
+
+                kept = batch.filter(keep)
+                stats['kept'] += kept.num_rows
+                stats['unassigned'] += pc.sum(pc.cast(unassigned, pa.int64())).as_py() or 0
+                stats['cells'].update(pc.unique(cell_ids.filter(has_polygon)).to_pylist())
+                if kept.num_rows:
+                    pending.append(pool.submit(serialize_block, pa.Table.from_batches([kept])))
+
+                # Cell has no polygon - remove the row
+                orphans = cells.filter(pc.invert(keep))
+                if len(orphans):
+                    stats['removed'] += len(orphans)
+                    sample = stats['orphaned_sample']
+                    if len(sample) < 10:
+                        sample.extend(orphans.slice(0, 10 - len(sample)).to_pylist())
+                    for entry in pc.value_counts(orphans).to_pylist():
+                        stats['orphaned_counts'][entry['values']] += entry['counts']
+
+                # Bound the number of serialized blocks held in memory
+                while len(pending) > 2 * threads:
+                    outfile.write(pending.popleft().result())
+
+            while pending:
+                outfile.write(pending.popleft().result())
+
+        return stats
+
+    except Exception as e:
+        print(f"Error processing CSV file: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def filter_polygons(polygons_path, cells, kept_cells, output_path):
+    """
+    Write the polygons whose cell still has transcripts.
+
+    Args:
+        polygons_path: Path to the merged polygon GeoParquet
+        cells: Cell ID of every polygon, as returned by read_polygon_cells
+        kept_cells: Set of cell IDs with transcripts in the validated CSV
+        output_path: Path for the filtered polygon GeoParquet
+
+    Returns:
+        tuple: (kept_count, list of removed cell IDs)
+    """
+    keep = pc.fill_null(pc.is_in(cells, value_set=pa.array(sorted(kept_cells), type=pa.string())), False)
+    polygons = read_polygons(polygons_path)
+    write_polygons(polygons.filter(keep), output_path)
+    return pc.sum(pc.cast(keep, pa.int64())).as_py() or 0, cells.filter(pc.invert(keep)).to_pylist()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Reconcile merged transcripts and polygons: drop rows without polygons '
+                    'and polygons without transcripts'
+    )
+    parser.add_argument(
+        '--csv',
+        required=True,
+        help='Path to the merged CSV file'
+    )
+    parser.add_argument(
+        '--polygons',
+        required=True,
+        help='Path to the merged polygon GeoParquet'
+    )
+    parser.add_argument(
+        '--out-csv',
+        required=True,
+        help='Path for the validated CSV output'
+    )
+    parser.add_argument(
+        '--out-polygons',
+        required=True,
+        help='Path for the filtered polygon GeoParquet'
+    )
+    parser.add_argument(
+        '--report',
+        default='reconciliation_report.json',
+        help='Path for the reconciliation report (default: reconciliation_report.json)'
+    )
+    parser.add_argument(
+        '--cell-column',
+        default='cell',
+        help='Name of the cell column in CSV (default: cell)'
+    )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=4,
+        help='Number of threads used to write validated blocks (default: 4)'
+    )
+
+    args = parser.parse_args()
+
+    print("Starting reconciliation of cells and polygons...", file=sys.stderr)
+
+    # Polygon cell IDs (only the cell column of the polygons is read)
+    cells = read_polygon_cells(args.polygons)
+    polygon_set = set(pc.unique(cells.drop_null()).to_pylist())
+    print(f"Found {len(polygon_set)} unique cells in polygons", file=sys.stderr)
+
+    # Pass over the CSV: drop orphaned rows, collect cells that keep transcripts
+    print("Checking for orphaned cells in CSV...", file=sys.stderr)
+    stats = filter_csv(args.csv, polygon_set, args.out_csv, args.cell_column, args.threads)
+
+    # Drop polygons of cells without transcripts
+    kept_polygons, removed_polygons = filter_polygons(args.polygons, cells, stats['cells'], args.out_polygons)
+
+    top_orphaned = sorted(stats['orphaned_counts'].items(), key=lambda x: x[1], reverse=True)
+    report = {
+        'transcripts': {
+            'total': stats['rows'],
+            'kept': stats['kept'],
+            'removed': stats['removed'],
+            'unassigned': stats['unassigned'],
+            'orphaned_cells': len(stats['orphaned_counts']),
+            'top_orphaned_cells': [
+                {'cell': cell, 'transcripts': count} for cell, count in top_orphaned[:REPORT_TOP_CELLS]
+            ]
+        },
+        'polygons': {
+            'total': len(cells),
+            'kept': kept_polygons,
+            'removed': len(removed_polygons),
+            'removed_cells_sample': removed_polygons[:REPORT_TOP_CELLS]
+        },
+        'cells': len(stats['cells'])
+    }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    # Report results
+    if stats['removed'] > 0:
+        print(f"\nWARNING: Removed {stats['removed']} transcript rows with no corresponding polygon", file=sys.stderr)
+        orphaned_cells = stats['orphaned_sample']
+        if stats['removed'] <= 10:
+            print(f"Orphaned cells: {', '.join(orphaned_cells)}", file=sys.stderr)
+        else:
+            print(f"Orphaned cells (first 10): {', '.join(orphaned_cells)}...", file=sys.stderr)
+        print(f"Total unique orphaned cell IDs: {len(stats['orphaned_counts'])}", file=sys.stderr)
+        print(f"Top orphaned cells by transcript count:", file=sys.stderr)
+        for cell, count in top_orphaned[:5]:
+            print(f"  {cell}: {count} transcripts", file=sys.stderr)
+
+    print(f"\nFinal reconciliation complete:", file=sys.stderr)
+    print(f"  - Validated CSV rows: {stats['kept']}", file=sys.stderr)
+    print(f"  - Removed orphaned rows: {stats['removed']}", file=sys.stderr)
+    print(f"  - Original polygons: {len(cells)}", file=sys.stderr)
+    print(f"  - Filtered polygons: {kept_polygons}", file=sys.stderr)
+    print(f"  - Removed polygons: {len(removed_polygons)}", file=sys.stderr)
+
+    print(f"\nValidated CSV written to {args.out_csv}, filtered polygons to {args.out_polygons}, "
+          f"report to {args.report}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Build the per-cell geometry sidecar used by segger_xenium_explorer.py --geometry-cache.
+
+Cell boundaries, nucleus hulls, areas and centroids are computed once from the segmentation
+parquet, before any area filter, and written as a Parquet file tagged with a key of the
+input and settings. The Explorer export then only reapplies the area thresholds and writes
+the zarr stores, so changing area_low / area_high does not recompute any geometry.
+"""
+
+import sys
+import argparse
+from pathlib import Path
+from segger_xenium_explorer import (
+    MAX_POLYGON_VERTICES,
+    STREAM_BATCH_ROWS,
+    build_cell_geometry,
+    geometry_cache_key,
+    iter_cell_batches,
+    load_segmentation,
+    read_geometry_cache,
+    write_geometry_cache,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compute the per-cell geometry sidecar for the Xenium Explorer export"
+    )
+    parser.add_argument("seg_df", help="Path to the segmentation parquet")
+    parser.add_argument("output", help="Path for the geometry sidecar parquet")
+    parser.add_argument(
+        "--cell-id-column",
+        default="seg_cell_id",
+        help="Column containing cell IDs (default: seg_cell_id)"
+    )
+    parser.add_argument(
+        "--max-vertices",
+        type=int,
+        default=MAX_POLYGON_VERTICES,
+        help=f"Vertex budget of the cell and nucleus polygons (default: {MAX_POLYGON_VERTICES})"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to build cell boundaries (default: 1)"
+    )
+    parser.add_argument(
+        "--feature-counts",
+        action="store_true",
+        help="Also store the per-cell feature_name counts used by --count-matrix"
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Read the segmentation in row batches; the parquet must be sorted by the cell ID column"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=STREAM_BATCH_ROWS,
+        help=f"Rows read per batch with --streaming (default: {STREAM_BATCH_ROWS})"
+    )
+    args = parser.parse_args()
+
+    if args.max_vertices < 4:
+        parser.error(f"--max-vertices must be at least 4, got {args.max_vertices}")
+    if not Path(args.seg_df).exists():
+        print(f"Error: Segmentation file not found: {args.seg_df}", file=sys.stderr)
+        sys.exit(1)
+
+    key = geometry_cache_key(args.seg_df, args.cell_id_column, args.max_vertices)
+    cached = read_geometry_cache(args.output, key, features=args.feature_counts)
+    if cached is not None:
+        print(f"{args.output} is up to date ({cached.num_rows} cells)")
+        return
+
+    try:
+        if args.streaming:
+            seg_df = iter_cell_batches(args.seg_df, args.cell_id_column, args.batch_size, args.feature_counts)
+        else:
+            seg_df = load_segmentation(args.seg_df, args.cell_id_column, args.feature_counts)
+        geometry = build_cell_geometry(
+            seg_df, args.cell_id_column, args.workers, args.max_vertices, features=args.feature_counts
+        )
+    except Exception as e:
+        print(f"Error computing cell geometry: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    write_geometry_cache(geometry, args.output, key)
+    print(f"Wrote geometry of {geometry.num_rows} cells to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,84 +8,617 @@ import sys
 import argparse
 import json
 from pathlib import Path
-import gzip
+import hashlib
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from scipy.spatial import ConvexHull
-from shapely.geometry import MultiPolygon, Polygon
-import matplotlib.pyplot as plt
+import shapely
+from shapely.geometry import Polygon
 from tqdm import tqdm
-from typing import Dict, Any, Optional, List, Tuple
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Any, Iterable, Iterator, Optional, List, Tuple, Union
 from segger.prediction.boundary import generate_boundary
-from zarr.storage import ZipStore
+from zarr.storage import DirectoryStore, ZipStore
 import zarr
+from numcodecs import Blosc, blosc
+from cell_id_codec import decode_xenium_ids
 
 
-def get_flatten_version(polygon_vertices: List[List[Tuple[float, float]]], max_value: int = 21) -> np.ndarray:
-    """Standardize list of polygon vertices to a fixed shape.
+class PolygonBuffer:
+    """Fixed-width polygon store backed by one preallocated (capacity, max_vertices, 2) float32 array.
+
+    Polygons are written in place and zero-padded, and the capacity doubles when it runs out.
+    They have at most `max_vertices` vertices (fit_vertex_budget simplifies the larger ones),
+    and the vertex count of every polygon is kept.
+
+    Args:
+        max_vertices (int): Number of vertex slots per polygon.
+        capacity (int): Number of polygons to preallocate.
+    """
+
+    def __init__(self, max_vertices: int = 128, capacity: int = 1024):
+        self.max_vertices = max_vertices
+        self.size = 0
+        self._vertices = np.zeros((max(capacity, 1), max_vertices, 2), dtype=np.float32)
+        self._num_vertices = np.zeros(max(capacity, 1), dtype=np.int32)
+
+    def _reserve(self, size: int) -> None:
+        capacity = len(self._num_vertices)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        vertices = np.zeros((capacity, self.max_vertices, 2), dtype=np.float32)
+        vertices[: self.size] = self._vertices[: self.size]
+        num_vertices = np.zeros(capacity, dtype=np.int32)
+        num_vertices[: self.size] = self._num_vertices[: self.size]
+        self._vertices, self._num_vertices = vertices, num_vertices
+
+    def append(self, vertices: np.ndarray) -> None:
+        """Append one polygon given as an (n, 2) array of vertices."""
+        self._reserve(self.size + 1)
+        n = min(len(vertices), self.max_vertices)
+        self._vertices[self.size, :n] = vertices[:n]
+        self._num_vertices[self.size] = len(vertices)
+        self.size += 1
+
+    def extend(self, vertices: np.ndarray, num_vertices: np.ndarray) -> None:
+        """Append many polygons given as their concatenated vertices and per-polygon vertex counts."""
+        self._reserve(self.size + len(num_vertices))
+        polygon = np.repeat(np.arange(len(num_vertices)), num_vertices)
+        position = np.arange(len(vertices)) - np.repeat(np.cumsum(num_vertices) - num_vertices, num_vertices)
+        fits = position < self.max_vertices
+        self._vertices[self.size + polygon[fits], position[fits]] = vertices[fits]
+        self._num_vertices[self.size : self.size + len(num_vertices)] = num_vertices
+        self.size += len(num_vertices)
+
+    @property
+    def vertices(self) -> np.ndarray:
+        """(size, max_vertices, 2) view of the stored polygons."""
+        return self._vertices[: self.size]
+
+    @property
+    def num_vertices(self) -> np.ndarray:
+        """Vertex count of every stored polygon."""
+        return self._num_vertices[: self.size]
+
+
+GEOMETRY_COLUMNS = ["x_location", "y_location"]
+CHUNKS_PER_WORKER = 8
+MIN_CELL_TRANSCRIPTS = 5
+STREAM_BATCH_ROWS = 5_000_000
+ZARR_CHUNK_CELLS = 32_768
+ZARR_COMPRESSORS = ["zstd", "lz4"]
+ZARR_COMPRESSION_LEVEL = 5
+MAX_POLYGON_VERTICES = 128
+AREA_TOLERANCE = 0.05
+SIMPLIFY_ITERATIONS = 24
+GEOMETRY_CACHE_KEY = b"explorer_geometry_key"
+GEOMETRY_CACHE_VERSION = 2
+FEATURE_NAMES_KEY = b"feature_names"
+FEATURE_COUNT_BLOCK = 1 << 24
+COUNT_MATRIX_FORMATS = ["zarr", "h5ad"]
+
+
+def cell_statistics(
+    cell_codes: np.ndarray, n_cells: int, x: np.ndarray, y: np.ndarray, z: np.ndarray, nucleus: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """Per-cell transcript counts, centroids and z-levels in one bincount pass over the cell codes.
 
     Args:
-        polygon_vertices (List[List[Tuple[float, float]]]): List of polygon coordinate lists.
-        max_value (int): Max number of coordinates per polygon.
+        cell_codes (np.ndarray): Cell index of every row (-1 for rows without a cell).
+        n_cells (int): Number of cells.
+        x (np.ndarray): x_location of every row.
+        y (np.ndarray): y_location of every row.
+        z (np.ndarray): z_location of every row.
+        nucleus (np.ndarray): Whether every row overlaps the nucleus.
 
     Returns:
-        np.ndarray: Padded or truncated list of polygon vertices.
+        Dict[str, np.ndarray]: Arrays indexed by cell: n_transcripts, n_nucleus, centroid_x,
+        centroid_y and z_level (mean z rounded down to a multiple of 3).
     """
-    flattened = []
-    
-    for vertices in polygon_vertices:
-        # Convert to numpy array if not already
-        if isinstance(vertices, np.ndarray):
-            vertices_array = vertices
+    assigned = cell_codes >= 0
+    codes = cell_codes[assigned]
+    n_transcripts = np.bincount(codes, minlength=n_cells)
+    counts = np.maximum(n_transcripts, 1)
+
+    def mean(values):
+        return np.bincount(codes, weights=values[assigned], minlength=n_cells) / counts
+
+    return {
+        "n_transcripts": n_transcripts,
+        "n_nucleus": np.bincount(codes, weights=nucleus[assigned], minlength=n_cells).astype(np.int64),
+        "centroid_x": mean(x),
+        "centroid_y": mean(y),
+        "z_level": np.floor_divide(mean(z), 3).round(0) * 3,
+    }
+
+
+def resample_ring(vertices: np.ndarray, max_vertices: int, closed: bool) -> np.ndarray:
+    """Keep `max_vertices` vertices spread evenly along the ring (re-closing it if `closed`)."""
+    ring = vertices[:-1] if closed else vertices
+    ring = ring[np.linspace(0, len(ring), max_vertices - int(closed), endpoint=False).astype(np.int64)]
+    return np.concatenate([ring, ring[:1]]) if closed else ring
+
+
+def fit_vertex_budget(
+    polygons: List[np.ndarray], max_vertices: int, closed: bool
+) -> Tuple[List[np.ndarray], np.ndarray, np.ndarray]:
+    """Simplify the polygons with more than `max_vertices` vertices so that every polygon fits the budget.
+
+    The over-budget polygons are simplified together with topology-preserving Douglas-Peucker
+    (shapely.simplify on the whole array). Each one gets its own tolerance, found by a bisection run
+    on all of them at once: the smallest tolerance, i.e. the least change in shape, that meets the budget.
+
+    Polygons that still do not fit (e.g. self-intersecting rings, which the topology-preserving
+    simplifier leaves alone) are simplified without preserving topology, doubling the tolerance
+    until they fit. Any left after that keep vertices spread evenly along the ring, so no polygon
+    is ever truncated.
+
+    Args:
+        polygons (List[np.ndarray]): (n, 2) float32 vertex arrays.
+        max_vertices (int): Vertex budget per polygon (at least 4).
+        closed (bool): Whether the arrays repeat their first vertex at the end (the repeat counts
+            towards the budget).
+
+    Returns:
+        Tuple[List[np.ndarray], np.ndarray, np.ndarray]: The polygons, the relative area change of
+        each (NaN for polygons that were not simplified), and whether each needed the fallback.
+    """
+    area_change = np.full(len(polygons), np.nan)
+    fallback = np.zeros(len(polygons), dtype=bool)
+    over = [i for i, vertices in enumerate(polygons) if len(vertices) > max_vertices]
+    if not over:
+        return polygons, area_change, fallback
+
+    opening = 0 if closed else 1
+    geometries = np.array([Polygon(polygons[i]) for i in over], dtype=object)
+
+    def fitting(simplified):
+        return (shapely.get_num_coordinates(simplified) - opening <= max_vertices) & \
+            (shapely.get_type_id(simplified) == 3) & ~shapely.is_empty(simplified)
+
+    bounds = shapely.bounds(geometries)
+    low = np.zeros(len(over))
+    high = np.hypot(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1])
+    for _ in range(SIMPLIFY_ITERATIONS):
+        tolerance = (low + high) / 2
+        simplified = shapely.simplify(geometries, tolerance, preserve_topology=True)
+        fits = fitting(simplified)
+        high = np.where(fits, tolerance, high)
+        low = np.where(fits, low, tolerance)
+
+    simplified = shapely.simplify(geometries, high, preserve_topology=True)
+    fits = fitting(simplified)
+    fallback[over] = ~fits
+    tolerance = high
+    for _ in range(SIMPLIFY_ITERATIONS):
+        if fits.all():
+            break
+        tolerance = np.where(fits, tolerance, 2 * tolerance)
+        simplified[~fits] = shapely.simplify(geometries[~fits], tolerance[~fits], preserve_topology=False)
+        fits = fitting(simplified)
+
+    polygons = list(polygons)
+    for j, (i, geometry) in enumerate(zip(over, simplified)):
+        if fits[j]:
+            coords = np.asarray(geometry.exterior.coords, dtype=np.float32)
+            polygons[i] = coords[: len(coords) - opening]
         else:
-            vertices_array = np.array(vertices)
-        
-        # Ensure it's 2D with shape (n, 2)
-        if vertices_array.ndim == 1:
-            # Handle empty or malformed arrays
-            if len(vertices_array) == 0:
-                vertices_array = np.array([]).reshape(0, 2)
-            else:
-                # Try to reshape if it's a flattened array
-                try:
-                    vertices_array = vertices_array.reshape(-1, 2)
-                except:
-                    # If reshape fails, skip this polygon
-                    print(f"Warning: Could not reshape vertices array with shape {vertices_array.shape}")
-                    vertices_array = np.array([[0.0, 0.0]])
-        
-        # Get the number of vertices
-        n_vertices = len(vertices_array)
-        
-        if n_vertices > max_value:
-            # Truncate to max_value
-            result = vertices_array[:max_value]
-        elif n_vertices < max_value:
-            # Pad with zeros to reach max_value
-            padding = np.zeros((max_value - n_vertices, 2), dtype=np.float32)
-            if n_vertices > 0:
-                result = np.vstack([vertices_array, padding])
-            else:
-                result = padding
+            polygons[i] = resample_ring(polygons[i], max_vertices, closed)
+            simplified[j] = Polygon(polygons[i])
+
+    area = shapely.area(geometries)
+    area_change[over] = np.abs(shapely.area(simplified) - area) / np.maximum(area, np.finfo(np.float64).tiny)
+    return polygons, area_change, fallback
+
+
+def process_cell_chunk(
+    chunk: pd.DataFrame,
+    nucleus: np.ndarray,
+    cell_starts: np.ndarray,
+    cell_index: np.ndarray,
+    max_vertices: int = MAX_POLYGON_VERTICES,
+) -> Dict[str, np.ndarray]:
+    """Build the boundary and nucleus hull of every cell in a contiguous chunk of rows.
+
+    No area filter is applied here, so the result can be cached and filtered with any thresholds.
+
+    Args:
+        chunk (pd.DataFrame): x/y of the transcripts of consecutive cells, sorted by cell.
+        nucleus (np.ndarray): Whether each row of the chunk overlaps the nucleus.
+        cell_starts (np.ndarray): Row offset of each cell within the chunk.
+        cell_index (np.ndarray): 1-based index of each cell in the sorted cell order.
+        max_vertices (int): Vertex budget of every polygon (see fit_vertex_budget).
+
+    Returns:
+        Dict[str, np.ndarray]: Compact arrays for the cells with a boundary: 1-based cell index,
+        boundary area, per-cell vertex counts with the concatenated vertices of the cell and nucleus
+        polygons, the relative area change of each simplified polygon (NaN otherwise) and whether
+        it needed the fallback simplification.
+    """
+    kept = []
+    areas = []
+    num_vertices: List[List[int]] = [[], []]
+    vertices: List[List[np.ndarray]] = [[], []]
+    cell_ends = np.append(cell_starts[1:], len(chunk))
+    coords = chunk.to_numpy()
+
+    for index, start, end in zip(cell_index, cell_starts, cell_ends):
+        cell_convex_hull = generate_boundary(chunk.iloc[start:end])
+        if cell_convex_hull is None or not isinstance(cell_convex_hull, Polygon):
+            continue
+
+        nucleus_coords = coords[start:end][nucleus[start:end]]
+        nucleus_convex_hull = None
+        if len(nucleus_coords) >= 3:
+            try:
+                nucleus_convex_hull = ConvexHull(nucleus_coords)
+            except Exception:
+                pass
+
+        kept.append(index)
+        areas.append(cell_convex_hull.area)
+        cell_coords = np.asarray(cell_convex_hull.exterior.coords, dtype=np.float32)
+        num_vertices[0].append(len(cell_coords))
+        vertices[0].append(cell_coords)
+
+        if nucleus_convex_hull is not None:
+            num_vertices[1].append(len(nucleus_convex_hull.vertices))
+            vertices[1].append(nucleus_coords[nucleus_convex_hull.vertices].astype(np.float32))
         else:
-            # Exactly max_value vertices
-            result = vertices_array
-        
-        # Ensure the result has the correct shape and type
-        result = np.array(result, dtype=np.float32)
-        if result.shape != (max_value, 2):
-            print(f"Warning: Unexpected shape {result.shape}, expected ({max_value}, 2)")
-            # Force to correct shape
-            result = np.zeros((max_value, 2), dtype=np.float32)
-        
-        flattened.append(result)
-    
-    # Stack all polygons into a single array
-    return np.array(flattened, dtype=np.float32)
+            num_vertices[1].append(0)
 
+    # Cell boundaries repeat their first vertex, nucleus hull vertices do not
+    vertices[0], cell_area_change, cell_fallback = fit_vertex_budget(vertices[0], max_vertices, closed=True)
+    vertices[1], hull_area_change, hull_fallback = fit_vertex_budget(vertices[1], max_vertices, closed=False)
+    has_nucleus = np.array(num_vertices[1], dtype=np.int32) > 0
+    nucleus_area_change = np.full(len(kept), np.nan)
+    nucleus_area_change[has_nucleus] = hull_area_change
+    nucleus_fallback = np.zeros(len(kept), dtype=bool)
+    nucleus_fallback[has_nucleus] = hull_fallback
 
-def seg2explorer(
+    def concat(arrays):
+        return np.concatenate(arrays) if arrays else np.empty((0, 2), dtype=np.float32)
+
+    nucleus_num_vertices = np.zeros(len(kept), dtype=np.int32)
+    nucleus_num_vertices[has_nucleus] = [len(v) for v in vertices[1]]
+    return {
+        "cell_index": np.array(kept, dtype=np.int64),
+        "cell_area": np.array(areas, dtype=np.float64),
+        "cell_num_vertices": np.array([len(v) for v in vertices[0]], dtype=np.int32),
+        "cell_vertices": concat(vertices[0]),
+        "cell_area_change": cell_area_change,
+        "cell_fallback": cell_fallback,
+        "nucleus_num_vertices": nucleus_num_vertices,
+        "nucleus_vertices": concat(vertices[1]),
+        "nucleus_area_change": nucleus_area_change,
+        "nucleus_fallback": nucleus_fallback,
+    }
+
+
+def shard_cells(cell_codes: np.ndarray, n_chunks: int) -> Tuple[np.ndarray, np.ndarray, List[Tuple[int, int]]]:
+    """Sort rows by cell and split them into contiguous chunks of whole cells with similar row counts.
+
+    Args:
+        cell_codes (np.ndarray): Sorted-order cell index of every row (-1 for rows without a cell).
+        n_chunks (int): Number of chunks to aim for.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, List[Tuple[int, int]]]: Row order (cell-sorted, rows without
+        a cell dropped), start row of every cell in that order, and the [first, last) cell range of each chunk.
+    """
+    order = np.flatnonzero(cell_codes >= 0)
+    order = order[np.argsort(cell_codes[order], kind="stable")]
+    sorted_codes = cell_codes[order]
+    cell_starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(order) else np.array([], dtype=np.int64)
+
+    # Cut at the cell starting closest after each row quantile so chunks stay balanced
+    cuts = np.searchsorted(cell_starts, np.linspace(0, len(order), n_chunks + 1)[1:-1])
+    bounds = np.unique(np.r_[0, cuts, len(cell_starts)])
+    return order, cell_starts, list(zip(bounds[:-1], bounds[1:]))
+
+
+def factorize_sorted(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Codes of the values in sorted order (-1 for missing), like iterating groupby(values).
+
+    Categorical values are recoded through their (sorted) categories instead of hashing every row.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Code of every row and the value of every code.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.cat.remove_unused_categories()
+        values = values.cat.reorder_categories(values.cat.categories.sort_values())
+        return values.cat.codes.to_numpy().astype(np.int64), np.asarray(values.cat.categories)
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes, np.asarray(uniques)
+
+
+def cell_feature_counts(
+    cell_starts: np.ndarray, feature_codes: np.ndarray, n_features: int, block_size: int = FEATURE_COUNT_BLOCK
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """CSR cell x feature counts of rows sorted by cell.
+
+    Cells are processed in blocks small enough for a dense bincount over (cell, feature) pairs;
+    the nonzero entries of each block come out in row-major order, i.e. already in CSR order.
+
+    Args:
+        cell_starts (np.ndarray): Start row of every cell.
+        feature_codes (np.ndarray): Feature code of every row (-1 for missing).
+        n_features (int): Number of features.
+        block_size (int): Maximum number of (cell, feature) bins counted at once.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: indptr (int64, one entry per cell plus one),
+        feature indices (int32) and counts (int32).
+    """
+    n_cells = len(cell_starts)
+    cell_ends = np.append(cell_starts[1:], len(feature_codes))
+    block_cells = max(1, block_size // max(n_features, 1))
+    nnz = np.zeros(n_cells, dtype=np.int64)
+    indices = [np.empty(0, dtype=np.int32)]
+    data = [np.empty(0, dtype=np.int32)]
+    for first in range(0, n_cells, block_cells):
+        last = min(first + block_cells, n_cells)
+        codes = feature_codes[cell_starts[first]:cell_ends[last - 1]]
+        local_cell = np.repeat(np.arange(last - first), cell_ends[first:last] - cell_starts[first:last])
+        valid = codes >= 0
+        counts = np.bincount(
+            local_cell[valid] * n_features + codes[valid], minlength=(last - first) * n_features
+        ).reshape(last - first, n_features)
+        cell, feature = np.nonzero(counts)
+        nnz[first:last] = np.bincount(cell, minlength=last - first)
+        indices.append(feature.astype(np.int32))
+        data.append(counts[cell, feature].astype(np.int32))
+
+    indptr = np.zeros(n_cells + 1, dtype=np.int64)
+    np.cumsum(nnz, out=indptr[1:])
+    return indptr, np.concatenate(indices), np.concatenate(data)
+
+
+def polygon_column(vertices: np.ndarray, num_vertices: np.ndarray) -> pa.LargeListArray:
+    """Pack concatenated (n, 2) vertices into one list of interleaved x/y values per polygon."""
+    offsets = np.zeros(len(num_vertices) + 1, dtype=np.int64)
+    np.cumsum(2 * np.asarray(num_vertices, dtype=np.int64), out=offsets[1:])
+    return pa.LargeListArray.from_arrays(pa.array(offsets), pa.array(vertices.reshape(-1), type=pa.float32()))
+
+
+def polygon_arrays(column: pa.ChunkedArray) -> Tuple[np.ndarray, np.ndarray]:
+    """Unpack a polygon_column into concatenated (n, 2) float32 vertices and per-polygon vertex counts."""
+    num_vertices = pc.list_value_length(column).to_numpy(zero_copy_only=False).astype(np.int32) // 2
+    vertices = pc.list_flatten(column).to_numpy(zero_copy_only=False).astype(np.float32, copy=False)
+    return vertices.reshape(-1, 2), num_vertices
+
+
+def compute_cell_geometry(
     seg_df: pd.DataFrame,
+    cell_id_columns: str,
+    pool: Optional[ProcessPoolExecutor] = None,
+    n_chunks: int = 1,
+    first_index: int = 0,
+    max_vertices: int = MAX_POLYGON_VERTICES,
+    features: bool = False,
+) -> Tuple[pa.Table, int]:
+    """Summary statistics and polygons of the cells of one dataframe of whole cells.
+
+    Args:
+        seg_df (pd.DataFrame): Segmented transcripts (every cell complete).
+        cell_id_columns (str): Column containing cell IDs.
+        pool (Optional[ProcessPoolExecutor]): Pool running the geometry chunks (None = in-process).
+        n_chunks (int): Number of contiguous chunks the cells are split into.
+        first_index (int): Number of cells in earlier dataframes, added to the cell indices.
+        max_vertices (int): Vertex budget of every polygon.
+        features (bool): Also count the feature_name values of every cell.
+
+    Returns:
+        Tuple[pa.Table, int]: One row per cell with a boundary (before any area filter): 1-based
+        cell_index, cell_key (original ID), centroid_x, centroid_y, z_level, cell_area, the cell
+        and nucleus polygons (see polygon_column) and their relative area change from
+        simplification (NaN if not simplified); with `features`, the feature_index and
+        feature_count lists of every cell and the feature names in the schema metadata.
+        Also returns the number of cells seen.
+    """
+    # Cells are numbered in sorted cell ID order, like iterating groupby(cell_id_columns)
+    cell_codes, cell_keys = factorize_sorted(seg_df[cell_id_columns])
+    nucleus = (seg_df["overlaps_nucleus"] == 1).to_numpy()
+    stats = cell_statistics(
+        cell_codes, len(cell_keys),
+        seg_df["x_location"].to_numpy(np.float64), seg_df["y_location"].to_numpy(np.float64),
+        seg_df["z_location"].to_numpy(np.float64), nucleus,
+    )
+
+    # Cells with too few transcripts never reach the geometry step
+    small = stats["n_transcripts"] < MIN_CELL_TRANSCRIPTS
+    cell_codes = np.where((cell_codes >= 0) & small[np.maximum(cell_codes, 0)], -1, cell_codes)
+
+    order, cell_starts, chunks = shard_cells(cell_codes, n_chunks)
+    geometry_df = seg_df[GEOMETRY_COLUMNS].iloc[order]
+    nucleus = nucleus[order]
+    cell_index = cell_codes[order][cell_starts] + 1
+
+    def chunk_args(first, last):
+        row_start = cell_starts[first]
+        row_end = cell_starts[last] if last < len(cell_starts) else len(order)
+        return (geometry_df.iloc[row_start:row_end], nucleus[row_start:row_end],
+                cell_starts[first:last] - row_start, cell_index[first:last])
+
+    # Contiguous chunks of cells run on the process pool; map keeps them in cell order
+    chunk_inputs = [chunk_args(first, last) for first, last in chunks]
+    mapper = pool.map if pool is not None else map
+    results = list(tqdm(
+        mapper(process_cell_chunk, *zip(*chunk_inputs), [max_vertices] * len(chunks)),
+        total=len(chunks), desc="Processing cells"
+    )) if chunks else []
+
+    def gather(key, empty):
+        return np.concatenate([r[key] for r in results]) if results else empty
+
+    kept = gather("cell_index", np.empty(0, dtype=np.int64))
+    summary_index = kept - 1
+    geometry = pa.table({
+        "cell_index": kept + first_index,
+        "cell_key": cell_keys[summary_index],
+        "centroid_x": stats["centroid_x"][summary_index],
+        "centroid_y": stats["centroid_y"][summary_index],
+        "z_level": stats["z_level"][summary_index],
+        "cell_area": gather("cell_area", np.empty(0)),
+        "cell_polygon": polygon_column(
+            gather("cell_vertices", np.empty((0, 2), dtype=np.float32)),
+            gather("cell_num_vertices", np.empty(0, dtype=np.int32)),
+        ),
+        "cell_area_change": gather("cell_area_change", np.empty(0)),
+        "cell_fallback": gather("cell_fallback", np.empty(0, dtype=bool)),
+        "nucleus_polygon": polygon_column(
+            gather("nucleus_vertices", np.empty((0, 2), dtype=np.float32)),
+            gather("nucleus_num_vertices", np.empty(0, dtype=np.int32)),
+        ),
+        "nucleus_area_change": gather("nucleus_area_change", np.empty(0)),
+        "nucleus_fallback": gather("nucleus_fallback", np.empty(0, dtype=bool)),
+    })
+    if features:
+        feature_codes, feature_names = factorize_sorted(seg_df["feature_name"])
+        indptr, indices, counts = cell_feature_counts(cell_starts, feature_codes[order], len(feature_names))
+        rows = pa.array(np.searchsorted(cell_index, kept))
+        offsets = pa.array(indptr)
+        geometry = geometry.append_column(
+            "feature_index", pa.LargeListArray.from_arrays(offsets, pa.array(indices)).take(rows)
+        ).append_column(
+            "feature_count", pa.LargeListArray.from_arrays(offsets, pa.array(counts)).take(rows)
+        ).replace_schema_metadata({FEATURE_NAMES_KEY: json.dumps([str(name) for name in feature_names])})
+    return geometry, len(cell_keys)
+
+
+def merge_feature_names(tables: List[pa.Table]) -> Tuple[List[pa.Table], List[str]]:
+    """Recode the feature_index lists of geometry tables to the sorted union of their feature names.
+
+    Returns:
+        Tuple[List[pa.Table], List[str]]: The recoded tables (without schema metadata) and the feature names.
+    """
+    table_names = [json.loads(t.schema.metadata[FEATURE_NAMES_KEY]) for t in tables]
+    names = sorted(set().union(*table_names))
+    recoded = []
+    for table, local_names in zip(tables, table_names):
+        column = table.column("feature_index").combine_chunks()
+        lengths = pc.list_value_length(column).to_numpy(zero_copy_only=False)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        codes = pd.Index(names).get_indexer(local_names).astype(np.int32)
+        values = codes[pc.list_flatten(column).to_numpy(zero_copy_only=False)]
+        column = pa.LargeListArray.from_arrays(pa.array(offsets), pa.array(values))
+        table = table.set_column(table.schema.get_field_index("feature_index"), "feature_index", column)
+        recoded.append(table.replace_schema_metadata(None))
+    return recoded, names
+
+
+def build_cell_geometry(
+    seg_df: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+    cell_id_columns: str,
+    workers: int = 1,
+    max_vertices: int = MAX_POLYGON_VERTICES,
+    features: bool = False,
+) -> pa.Table:
+    """Compute the geometry table (see compute_cell_geometry) of a whole segmentation.
+
+    Args:
+        seg_df (Union[pd.DataFrame, Iterable[pd.DataFrame]]): Segmented transcript dataframe, or
+            dataframes of whole cells in cell ID order (see iter_cell_batches).
+        cell_id_columns (str): Column containing cell IDs.
+        workers (int): Number of processes building cell boundaries and nucleus hulls.
+        max_vertices (int): Vertex budget of every polygon.
+        features (bool): Also count the feature_name values of every cell.
+
+    Returns:
+        pa.Table: Geometry of every cell with a boundary, in cell order.
+    """
+    batches = [seg_df] if isinstance(seg_df, pd.DataFrame) else seg_df
+    workers = max(1, workers)
+    tables = []
+    n_seen = 0
+    with (ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext()) as pool:
+        for batch in batches:
+            table, n_cells = compute_cell_geometry(
+                batch, cell_id_columns,
+                pool=pool, n_chunks=workers * CHUNKS_PER_WORKER, first_index=n_seen,
+                max_vertices=max_vertices, features=features,
+            )
+            n_seen += n_cells
+            tables.append(table)
+
+    # Batches without cells can carry a null-typed cell_key column
+    tables = [t for t in tables if t.num_rows] or tables[:1]
+    if not tables:
+        raise ValueError("No cells found in the segmentation")
+    if not features:
+        return pa.concat_tables(tables)
+
+    # Every batch has its own feature vocabulary
+    tables, feature_names = merge_feature_names(tables)
+    return pa.concat_tables(tables).replace_schema_metadata({FEATURE_NAMES_KEY: json.dumps(feature_names)})
+
+
+def geometry_cache_key(seg_path: str, cell_id_column: str, max_vertices: int) -> str:
+    """Hash identifying the geometry computed from a segmentation parquet.
+
+    The parquet is identified by its size and footer (schema, row group sizes and column
+    statistics), so the key survives copies and staging but changes with the content.
+
+    Args:
+        seg_path (str): Path to the segmentation parquet.
+        cell_id_column (str): Column containing cell IDs.
+        max_vertices (int): Vertex budget of the polygons.
+
+    Returns:
+        str: Hex digest of the key.
+    """
+    with open(seg_path, "rb") as f:
+        f.seek(-8, os.SEEK_END)
+        footer_length = int.from_bytes(f.read(4), "little")
+        f.seek(-8 - footer_length, os.SEEK_END)
+        digest = hashlib.sha256(f.read(footer_length))
+    settings = [os.path.getsize(seg_path), cell_id_column, max_vertices, MIN_CELL_TRANSCRIPTS, GEOMETRY_CACHE_VERSION]
+    digest.update(json.dumps(settings).encode())
+    return digest.hexdigest()
+
+
+def read_geometry_cache(path: str, key: str, features: bool = False) -> Optional[pa.Table]:
+    """Read a geometry sidecar, or return None when it is missing, unreadable, was built for
+    another key or lacks the feature counts asked for with `features` (the last three are logged)."""
+    if not os.path.exists(path):
+        return None
+    try:
+        schema = pq.read_schema(path)
+        metadata = schema.metadata or {}
+        found = metadata.get(GEOMETRY_CACHE_KEY)
+        if found != key.encode():
+            found = found.decode() if found is not None else "none"
+            print(f"Warning: Geometry cache {path} has key {found}, expected {key}; ignoring it", file=sys.stderr)
+            return None
+        if features and "feature_index" not in schema.names:
+            print(f"Warning: Geometry cache {path} has no feature counts; ignoring it", file=sys.stderr)
+            return None
+        return pq.read_table(path)
+    except (OSError, pa.ArrowInvalid) as e:
+        print(f"Warning: Could not read geometry cache {path}: {e}", file=sys.stderr)
+        return None
+
+
+def write_geometry_cache(geometry: pa.Table, path: str, key: str) -> None:
+    """Write a geometry sidecar tagged with its key (through a temporary file, so readers never see a partial one)."""
+    tmp_path = f"{path}.tmp"
+    metadata = {**(geometry.schema.metadata or {}), GEOMETRY_CACHE_KEY: key}
+    pq.write_table(geometry.replace_schema_metadata(metadata), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def seg2explorer(
+    seg_df: Union[pd.DataFrame, Iterable[pd.DataFrame]],
     source_path: str,
     output_dir: str,
     cells_filename: str = "seg_cells",
@@ -96,11 +629,23 @@ def seg2explorer(
     cell_id_columns: str = "seg_cell_id",
     area_low: float = 10,
     area_high: float = 100,
+    workers: int = 1,
+    chunk_cells: int = ZARR_CHUNK_CELLS,
+    compressor: str = "zstd",
+    compression_level: int = ZARR_COMPRESSION_LEVEL,
+    compression_threads: int = 1,
+    build_dir: Optional[str] = None,
+    max_vertices: int = MAX_POLYGON_VERTICES,
+    area_tolerance: float = AREA_TOLERANCE,
+    geometry: Optional[pa.Table] = None,
+    count_matrix: Optional[str] = None,
+    count_matrix_filename: str = "cell_feature_matrix",
 ) -> None:
     """Convert segmentation results into a Xenium Explorer-compatible Zarr dataset.
 
     Args:
-        seg_df (pd.DataFrame): Segmented transcript dataframe.
+        seg_df (Union[pd.DataFrame, Iterable[pd.DataFrame]]): Segmented transcript dataframe, or
+            dataframes of whole cells in cell ID order (see iter_cell_batches).
         source_path (str): Path to the original Zarr store.
         output_dir (str): Output directory to save new Zarr and Xenium files.
         cells_filename (str): Filename prefix for cell Zarr file.
@@ -111,6 +656,20 @@ def seg2explorer(
         cell_id_columns (str): Column containing cell IDs.
         area_low (float): Minimum area threshold to include cells.
         area_high (float): Maximum area threshold to include cells.
+        workers (int): Number of processes building cell boundaries and nucleus hulls.
+        chunk_cells (int): Number of cells per zarr chunk.
+        compressor (str): Blosc codec for the zarr arrays ("zstd" or "lz4").
+        compression_level (int): Blosc compression level.
+        compression_threads (int): Number of Blosc compression threads.
+        build_dir (Optional[str]): Build the zarr stores in this directory and zip them at
+            the end instead of writing the zip files directly.
+        max_vertices (int): Vertex budget of the cell and nucleus polygons; larger polygons are simplified.
+        area_tolerance (float): Relative area change above which simplified cells are counted and reported.
+        geometry (Optional[pa.Table]): Precomputed cell geometry (see build_cell_geometry, built with
+            the same `max_vertices`); when given, `seg_df` is not used and only the area filter is applied.
+        count_matrix (Optional[str]): Also write the cell x feature count matrix in this format
+            ("zarr" or "h5ad"), with rows in the order of the cell_id array. Needs feature_name.
+        count_matrix_filename (str): Filename prefix for the count matrix.
     """
     source_path = Path(source_path)
     storage = Path(output_dir)
@@ -118,97 +677,99 @@ def seg2explorer(
     # Create output directory if it doesn't exist
     storage.mkdir(parents=True, exist_ok=True)
 
-    cell_id2old_id: Dict[int, Any] = {}
-    cell_id: List[int] = []
-    cell_summary: List[Dict[str, Any]] = []
-    polygon_num_vertices: List[List[int]] = [[], []]
-    polygon_vertices: List[List[Any]] = [[], []]
-    seg_mask_value: List[int] = []
-
-    grouped_by = seg_df.groupby(cell_id_columns)
-
-    for cell_incremental_id, (seg_cell_id, seg_cell) in tqdm(
-        enumerate(grouped_by), total=len(grouped_by), desc="Processing cells"
-    ):
-        if len(seg_cell) < 5:
-            continue
-
-        cell_convex_hull = generate_boundary(seg_cell)
-        if cell_convex_hull is None or not isinstance(cell_convex_hull, Polygon):
-            continue
-
-        if not (area_low <= cell_convex_hull.area <= area_high):
-            continue
+    if geometry is None:
+        geometry = build_cell_geometry(seg_df, cell_id_columns, workers, max_vertices, features=count_matrix is not None)
+    if count_matrix is not None and "feature_index" not in geometry.column_names:
+        raise ValueError("The count matrix needs feature counts in the cell geometry (feature_name column)")
+    feature_names = json.loads((geometry.schema.metadata or {}).get(FEATURE_NAMES_KEY, b"[]"))
+    cell_area = geometry.column("cell_area").to_numpy()
+    geometry = geometry.filter(pa.array((cell_area >= area_low) & (cell_area <= area_high)))
 
-        uint_cell_id = cell_incremental_id + 1
-        cell_id2old_id[uint_cell_id] = seg_cell_id
+    def column(name):
+        return geometry.column(name).to_numpy(zero_copy_only=False)
 
-        seg_nucleous = seg_cell[seg_cell["overlaps_nucleus"] == 1]
-        nucleus_convex_hull = None
-        if len(seg_nucleous) >= 3:
-            try:
-                nucleus_convex_hull = ConvexHull(seg_nucleous[["x_location", "y_location"]])
-            except Exception:
-                pass
+    cell_id = column("cell_index")
+    cell_area = column("cell_area")
+    cell_summary = np.column_stack([
+        column("centroid_x"), column("centroid_y"), cell_area,
+        column("centroid_x"), column("centroid_y"), cell_area,
+        column("z_level"),
+    ])
+    cell_keys = column("cell_key")
+    cell_id2old_id: Dict[int, Any] = dict(zip(cell_id.tolist(), cell_keys))
+    seg_mask_value = cell_id
+    area_change = np.concatenate([column("cell_area_change"), column("nucleus_area_change")])
+    n_simplified = np.count_nonzero(~np.isnan(area_change))
+    if n_simplified:
+        print(f"Simplified {n_simplified} polygons to at most {max_vertices} vertices")
+    n_fallback = np.count_nonzero(column("cell_fallback") | column("nucleus_fallback"))
+    if n_fallback:
+        print(f"Warning: {n_fallback} cells needed the fallback simplification (topology not preserved "
+              f"or vertices resampled) to fit {max_vertices} vertices", file=sys.stderr)
+    n_over_tolerance = np.count_nonzero(
+        (column("cell_area_change") > area_tolerance) | (column("nucleus_area_change") > area_tolerance)
+    )
+    if n_over_tolerance:
+        print(f"Warning: {n_over_tolerance} cells changed cell or nucleus area by more than "
+              f"{area_tolerance:.0%} when simplified", file=sys.stderr)
 
-        cell_id.append(uint_cell_id)
-        cell_summary.append(
-            {
-                "cell_centroid_x": seg_cell["x_location"].mean(),
-                "cell_centroid_y": seg_cell["y_location"].mean(),
-                "cell_area": cell_convex_hull.area,
-                "nucleus_centroid_x": seg_cell["x_location"].mean(),
-                "nucleus_centroid_y": seg_cell["y_location"].mean(),
-                "nucleus_area": cell_convex_hull.area,
-                "z_level": (seg_cell.z_location.mean() // 3).round(0) * 3,
-            }
-        )
-        polygon_num_vertices[0].append(len(cell_convex_hull.exterior.coords))
-        polygon_num_vertices[1].append(
-            len(nucleus_convex_hull.vertices) if nucleus_convex_hull else 0
-        )
-        polygon_vertices[0].append(list(cell_convex_hull.exterior.coords))
-        
-        # Handle nucleus vertices properly
-        if nucleus_convex_hull is not None:
-            nucleus_vertices = seg_nucleous[["x_location", "y_location"]].values[nucleus_convex_hull.vertices]
-            polygon_vertices[1].append(nucleus_vertices.tolist())
-        else:
-            # Append empty array with correct shape for nucleus
-            polygon_vertices[1].append([])
-        seg_mask_value.append(uint_cell_id)
+    # Polygons go straight from the compact Arrow lists into fixed-width buffers
+    cell_polygons = PolygonBuffer(max_vertices=max_vertices, capacity=len(cell_id))
+    nucleus_polygons = PolygonBuffer(max_vertices=max_vertices, capacity=len(cell_id))
+    cell_polygons.extend(*polygon_arrays(geometry.column("cell_polygon")))
+    nucleus_polygons.extend(*polygon_arrays(geometry.column("nucleus_polygon")))
 
-    cell_polygon_vertices = get_flatten_version(polygon_vertices[0], max_value=128)
-    nucl_polygon_vertices = get_flatten_version(polygon_vertices[1], max_value=128)
+    # Per-cell feature lists in cell order are the rows of the CSR matrix
+    if count_matrix is not None:
+        nnz = pc.list_value_length(geometry.column("feature_index")).to_numpy(zero_copy_only=False)
+        feature_indptr = np.zeros(len(nnz) + 1, dtype=np.int64)
+        np.cumsum(nnz, out=feature_indptr[1:])
+        feature_indices = pc.list_flatten(geometry.column("feature_index")).to_numpy(zero_copy_only=False)
+        feature_counts = pc.list_flatten(geometry.column("feature_count")).to_numpy(zero_copy_only=False)
+    del geometry
 
     cells = {
         "cell_id": np.array(
             [np.array(cell_id), np.ones(len(cell_id))], dtype=np.uint32
         ).T,
-        "cell_summary": pd.DataFrame(cell_summary).values.astype(np.float64),
+        "cell_summary": cell_summary.astype(np.float64),
         "polygon_num_vertices": np.array(
-            [
-                [min(x + 1, x + 1) for x in polygon_num_vertices[1]],
-                [min(x + 1, x + 1) for x in polygon_num_vertices[0]],
-            ],
+            [nucleus_polygons.num_vertices + 1, cell_polygons.num_vertices + 1],
             dtype=np.int32,
         ),
-        "polygon_vertices": np.array(
-            [nucl_polygon_vertices, cell_polygon_vertices], dtype=np.float32
-        ),
         "seg_mask_value": np.array(seg_mask_value, dtype=np.int32),
     }
 
     source_zarr_store = ZipStore(source_path / "cells.zarr.zip", mode="r")
     existing_store = zarr.open(source_zarr_store, mode="r")
-    new_store = zarr.open(storage / f"{cells_filename}.zarr.zip", mode="w")
-    new_store["cell_id"] = cells["cell_id"]
-    new_store["polygon_num_vertices"] = cells["polygon_num_vertices"]
-    new_store["polygon_vertices"] = cells["polygon_vertices"]
-    new_store["seg_mask_value"] = cells["seg_mask_value"]
-    new_store.attrs.update(existing_store.attrs)
-    new_store.attrs["number_cells"] = len(cells["cell_id"])
-    new_store.store.close()
+    compressor = zarr_compressor(compressor, compression_level, compression_threads)
+    chunk_cells = max(1, chunk_cells)
+    with open_explorer_store(storage / f"{cells_filename}.zarr.zip", build_dir) as new_store:
+        new_store.array("cell_id", cells["cell_id"], chunks=(chunk_cells, 2), compressor=compressor)
+        new_store.array(
+            "polygon_num_vertices", cells["polygon_num_vertices"], chunks=(1, chunk_cells), compressor=compressor
+        )
+        # Written one layer at a time (0 = nucleus, 1 = cell) so the buffers are never stacked
+        polygon_vertices = new_store.zeros(
+            "polygon_vertices",
+            shape=(2,) + cell_polygons.vertices.shape,
+            chunks=(1, chunk_cells) + cell_polygons.vertices.shape[1:],
+            dtype=np.float32,
+            compressor=compressor,
+        )
+        polygon_vertices[0] = nucleus_polygons.vertices
+        polygon_vertices[1] = cell_polygons.vertices
+        new_store.array("seg_mask_value", cells["seg_mask_value"], chunks=(chunk_cells,), compressor=compressor)
+        # One attrs write: a ZipStore cannot replace an entry, so a second write duplicates .zattrs
+        new_store.attrs.update({**existing_store.attrs.asdict(), "number_cells": len(cells["cell_id"])})
+
+    if count_matrix is not None:
+        matrix_path = write_count_matrix(
+            storage / count_matrix_filename, count_matrix,
+            feature_indptr, feature_indices, feature_counts, feature_names,
+            cells["cell_id"], cell_keys, compressor=compressor, chunk_cells=chunk_cells, build_dir=build_dir,
+        )
+        print(f"Wrote {len(feature_indptr) - 1} x {len(feature_names)} count matrix to {matrix_path}")
 
     if analysis_df is None:
         analysis_df = pd.DataFrame(
@@ -222,38 +783,25 @@ def seg2explorer(
     clustering_df = pd.merge(zarr_df, analysis_df, how="left", on=cell_id_columns)
     clusters_names = [col for col in analysis_df.columns if col != cell_id_columns]
 
-    clusters_dict = {
-        cluster: {
-            label: idx + 1
-            for idx, label in enumerate(
-                sorted(np.unique(clustering_df[cluster].dropna()))
-            )
-        }
-        for cluster in clusters_names
-    }
+    group_codes, group_names = get_group_codes(clustering_df, clusters_names)
 
-    new_zarr = zarr.open(storage / f"{analysis_filename}.zarr.zip", mode="w")
-    new_zarr.create_group("/cell_groups")
-    for i, cluster in enumerate(clusters_names):
-        new_zarr["cell_groups"].create_group(str(i))
-        group_values = [clusters_dict[cluster].get(x, 0) for x in clustering_df[cluster]]
-        indices, indptr = get_indices_indptr(np.array(group_values))
-        new_zarr["cell_groups"][str(i)]["indices"] = indices
-        new_zarr["cell_groups"][str(i)]["indptr"] = indptr
-
-    new_zarr["cell_groups"].attrs.update(
-        {
-            "major_version": 1,
-            "minor_version": 0,
-            "number_groupings": len(clusters_names),
-            "grouping_names": clusters_names,
-            "group_names": [
-                sorted(clusters_dict[cluster], key=clusters_dict[cluster].get)
-                for cluster in clusters_names
-            ],
-        }
-    )
-    new_zarr.store.close()
+    with open_explorer_store(storage / f"{analysis_filename}.zarr.zip", build_dir) as new_zarr:
+        new_zarr.create_group("/cell_groups")
+        for i, cluster in enumerate(clusters_names):
+            group = new_zarr["cell_groups"].create_group(str(i))
+            indices, indptr = get_indices_indptr(group_codes[i])
+            group.array("indices", indices, chunks=(chunk_cells,), compressor=compressor)
+            group.array("indptr", indptr, chunks=(chunk_cells,), compressor=compressor)
+
+        new_zarr["cell_groups"].attrs.update(
+            {
+                "major_version": 1,
+                "minor_version": 0,
+                "number_groupings": len(clusters_names),
+                "grouping_names": clusters_names,
+                "group_names": group_names,
+            }
+        )
 
     generate_experiment_file(
         template_path=source_path / "experiment.xenium",
@@ -268,63 +816,278 @@ def seg2explorer(
     print(f"  - Experiment: {xenium_filename}")
 
 
-def str_to_uint32(cell_id_str: str) -> Tuple[int, int]:
-    """Convert a string cell ID back to uint32 format.
+def segmentation_columns(cell_id_column: str, features: bool = False) -> List[str]:
+    """Columns of the segmented transcript table that seg2explorer reads (plus feature_name for the count matrix)."""
+    columns = [cell_id_column, "x_location", "y_location", "z_location", "overlaps_nucleus"]
+    return columns + ["feature_name"] if features else columns
+
+
+def to_segmentation_frame(table: pa.Table) -> pd.DataFrame:
+    """Convert projected transcripts to pandas with float32 coordinates."""
+    seg_df = table.to_pandas()
+    for col in ("x_location", "y_location", "z_location"):
+        seg_df[col] = seg_df[col].astype(np.float32)
+    return seg_df
+
+
+def load_segmentation(path: str, cell_id_column: str, features: bool = False) -> pd.DataFrame:
+    """Load only the columns seg2explorer needs, with float32 coordinates and categorical cell IDs.
 
     Args:
-        cell_id_str (str): The cell ID in string format.
+        path (str): Path to the segmented transcript parquet.
+        cell_id_column (str): Column containing cell IDs.
+        features (bool): Also load feature_name (as a categorical).
 
     Returns:
-        Tuple[int, int]: The cell ID in uint32 format and the dataset suffix.
+        pd.DataFrame: Projected segmentation dataframe.
     """
-    prefix, suffix = cell_id_str.split("-")
-    str_to_hex_mapping = {
-        "a": "0",
-        "b": "1",
-        "c": "2",
-        "d": "3",
-        "e": "4",
-        "f": "5",
-        "g": "6",
-        "h": "7",
-        "i": "8",
-        "j": "9",
-        "k": "a",
-        "l": "b",
-        "m": "c",
-        "n": "d",
-        "o": "e",
-        "p": "f",
-    }
-    hex_prefix = "".join([str_to_hex_mapping[char] for char in prefix])
-    cell_id_uint32 = int(hex_prefix, 16)
-    dataset_suffix = int(suffix)
-    return cell_id_uint32, dataset_suffix
+    schema = pq.read_schema(path)
+    columns = segmentation_columns(cell_id_column, features)
+    missing = [col for col in columns if col not in schema.names]
+    if missing:
+        raise ValueError(f"Missing columns in {path}: {', '.join(missing)}")
+
+    # String cell IDs (and feature names) are read dictionary-encoded and arrive as pandas categoricals
+    read_dictionary = [
+        col for col in (cell_id_column, "feature_name") if col in columns
+        and (pa.types.is_string(schema.field(col).type) or pa.types.is_large_string(schema.field(col).type))
+    ]
+    return to_segmentation_frame(pq.read_table(path, columns=columns, read_dictionary=read_dictionary or None))
+
+
+def iter_cell_batches(
+    path: str, cell_id_column: str, batch_size: int = STREAM_BATCH_ROWS, features: bool = False
+) -> Iterator[pd.DataFrame]:
+    """Stream a cell-sorted segmentation parquet as dataframes of whole cells.
+
+    Rows are read batch by batch with only the needed columns; the rows of the last cell
+    of a batch are carried into the next one so no cell is split. Rows without a cell are
+    dropped. Peak memory is bounded by the largest batch rather than the whole table.
+
+    Args:
+        path (str): Path to the segmented transcript parquet, sorted by cell ID.
+        cell_id_column (str): Column containing cell IDs.
+        batch_size (int): Number of rows read per batch.
+        features (bool): Also read feature_name.
+
+    Yields:
+        pd.DataFrame: Transcripts of consecutive whole cells, in cell ID order.
+
+    Raises:
+        ValueError: If the rows are not sorted by cell ID.
+    """
+    parquet_file = pq.ParquetFile(path)
+    columns = segmentation_columns(cell_id_column, features)
+    missing = [col for col in columns if col not in parquet_file.schema_arrow.names]
+    if missing:
+        raise ValueError(f"Missing columns in {path}: {', '.join(missing)}")
+
+    carry = None
+    last_emitted = None
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        seg_df = to_segmentation_frame(pa.Table.from_batches([batch]))
+        seg_df = seg_df[seg_df[cell_id_column].notna()]
+        if carry is not None:
+            seg_df = pd.concat([carry, seg_df], ignore_index=True)
+        if seg_df.empty:
+            continue
+
+        cell_ids = seg_df[cell_id_column]
+        if not cell_ids.is_monotonic_increasing or (last_emitted is not None and cell_ids.iloc[0] <= last_emitted):
+            raise ValueError(f"Streaming mode needs {path} sorted by {cell_id_column}")
+
+        # The last cell may continue in the next batch
+        last_cell = cell_ids.iloc[-1]
+        complete = (cell_ids != last_cell).to_numpy()
+        carry = seg_df[~complete]
+        if complete.any():
+            last_emitted = cell_ids[complete].iloc[-1]
+            yield seg_df[complete]
+
+    if carry is not None and not carry.empty:
+        yield carry
 
 
 def get_indices_indptr(input_array: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
     """Get the indices and indptr arrays for sparse matrix representation.
 
+    Cells are ordered by cluster with one stable argsort and the group offsets come from
+    a bincount/cumsum. Unassigned cells (label 0) are written as trailing zeros.
+
     Args:
-        input_array (np.ndarray): The input array containing cluster labels.
+        input_array (np.ndarray): The input array containing cluster labels (1..K, 0 = none).
 
     Returns:
         Tuple[np.ndarray, np.ndarray]: The indices and indptr arrays.
     """
-    clusters = sorted(np.unique(input_array[input_array != 0]))
-    indptr = np.zeros(len(clusters), dtype=np.uint32)
-    indices = []
+    input_array = np.asarray(input_array, dtype=np.int64)
+    assigned = input_array != 0
+    counts = np.bincount(input_array[assigned])[1:]
+    indptr = (np.cumsum(counts) - counts).astype(np.uint32)
 
-    for cluster in clusters:
-        cluster_indices = np.where(input_array == cluster)[0]
-        indptr[cluster - 1] = len(indices)
-        indices.extend(cluster_indices)
-
-    indices.extend(-np.zeros(len(input_array[input_array == 0])))
-    indices = np.array(indices, dtype=np.int32).astype(np.uint32)
+    indices = np.zeros(len(input_array), dtype=np.uint32)
+    positions = np.flatnonzero(assigned)
+    indices[: len(positions)] = positions[np.argsort(input_array[positions], kind="stable")]
     return indices, indptr
 
 
+def get_group_codes(clustering_df: pd.DataFrame, clusters_names: List[str]) -> Tuple[np.ndarray, List[List[Any]]]:
+    """Encode every grouping column as 1-based codes of its sorted labels (0 for missing).
+
+    Args:
+        clustering_df (pd.DataFrame): Cluster annotations aligned with the written cells.
+        clusters_names (List[str]): Grouping columns to encode.
+
+    Returns:
+        Tuple[np.ndarray, List[List[Any]]]: (n_groupings, n_cells) code matrix and the
+        label names of each grouping in code order.
+    """
+    codes = np.zeros((len(clusters_names), len(clustering_df)), dtype=np.int64)
+    group_names = []
+    for i, cluster in enumerate(clusters_names):
+        cluster_codes, labels = pd.factorize(clustering_df[cluster], sort=True)
+        codes[i] = cluster_codes + 1
+        group_names.append(labels.tolist())
+    return codes, group_names
+
+
+def zarr_compressor(cname: str = "zstd", clevel: int = ZARR_COMPRESSION_LEVEL, threads: int = 1) -> Blosc:
+    """Create the Blosc compressor used for every array of the Explorer stores.
+
+    Blosc splits each chunk into blocks that are compressed by `threads` internal threads,
+    so large chunks are compressed in parallel even though zarr writes them one at a time.
+
+    Args:
+        cname (str): Blosc codec ("zstd" or "lz4").
+        clevel (int): Compression level (1-9).
+        threads (int): Number of Blosc threads.
+
+    Returns:
+        Blosc: The compressor.
+    """
+    threads = max(1, threads)
+    blosc.use_threads = threads > 1
+    blosc.set_nthreads(threads)
+    return Blosc(cname=cname, clevel=clevel, shuffle=Blosc.SHUFFLE)
+
+
+def zip_directory(directory: Path, zip_path: Path) -> None:
+    """Pack a zarr DirectoryStore into a zip readable as a ZipStore.
+
+    Entries are stored uncompressed since the chunks are already compressed by Blosc.
+
+    Args:
+        directory (Path): Root of the directory store.
+        zip_path (Path): Path of the zip file to write.
+    """
+    with zipfile.ZipFile(zip_path, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                path = Path(root) / name
+                zf.write(path, arcname=path.relative_to(directory).as_posix())
+
+
+@contextmanager
+def open_explorer_store(zip_path: Path, build_dir: Optional[str] = None) -> Iterator[zarr.Group]:
+    """Open an empty zarr group that is saved as `zip_path`.
+
+    Without `build_dir` the group is written straight into a ZipStore. With it, the group is
+    built as a DirectoryStore in a temporary directory under `build_dir` (e.g. local scratch)
+    and zipped into `zip_path` once the block exits.
+
+    Args:
+        zip_path (Path): Path of the output .zarr.zip file.
+        build_dir (Optional[str]): Directory in which to build the store before zipping it.
+
+    Yields:
+        zarr.Group: The root group of the new store.
+    """
+    if build_dir is None:
+        store = ZipStore(zip_path, mode="w")
+        try:
+            yield zarr.group(store=store, overwrite=True)
+        finally:
+            store.close()
+        return
+
+    Path(build_dir).mkdir(parents=True, exist_ok=True)
+    tmpdir = Path(tempfile.mkdtemp(prefix=f"{Path(zip_path).name}.", dir=build_dir))
+    try:
+        yield zarr.group(store=DirectoryStore(tmpdir), overwrite=True)
+        zip_directory(tmpdir, zip_path)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def write_count_matrix(
+    path: Path,
+    matrix_format: str,
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    counts: np.ndarray,
+    feature_names: List[str],
+    cell_id: np.ndarray,
+    cell_keys: np.ndarray,
+    compressor: Optional[Blosc] = None,
+    chunk_cells: int = ZARR_CHUNK_CELLS,
+    build_dir: Optional[str] = None,
+) -> Path:
+    """Write a CSR cell x feature count matrix whose rows follow the cells store.
+
+    The zarr format stores the matrix in group X with AnnData's csr_matrix encoding, next to the
+    cell_id array of the cells store and the feature names. The h5ad format needs the anndata package.
+    Both also store the string ID Xenium Explorer shows for every row ("aaaaaaab-1", decoded from
+    cell_id), so the rows can be joined with cell selections exported from Explorer.
+
+    Args:
+        path (Path): Output path without extension.
+        matrix_format (str): "zarr" (.zarr.zip) or "h5ad".
+        indptr (np.ndarray): CSR row pointers (one row per cell).
+        indices (np.ndarray): Feature index of every nonzero count.
+        counts (np.ndarray): Nonzero counts.
+        feature_names (List[str]): Name of every feature (column).
+        cell_id (np.ndarray): (n_cells, 2) uint32 cell_id array of the cells store.
+        cell_keys (np.ndarray): Original ID of every cell.
+        compressor (Optional[Blosc]): Compressor of the zarr arrays.
+        chunk_cells (int): Number of cells per zarr chunk.
+        build_dir (Optional[str]): Build the zarr store in this directory and zip it at the end.
+
+    Returns:
+        Path: Path of the written file.
+    """
+    shape = [len(indptr) - 1, len(feature_names)]
+    xenium_cell_id = decode_xenium_ids(cell_id[:, 0], cell_id[:, 1])
+    if matrix_format == "h5ad":
+        try:
+            import anndata
+        except ImportError:
+            raise ValueError("Writing the count matrix as h5ad needs the anndata package")
+        from scipy.sparse import csr_matrix
+
+        adata = anndata.AnnData(
+            X=csr_matrix((counts, indices, indptr), shape=tuple(shape)),
+            obs=pd.DataFrame({"cell_id": cell_id[:, 0], "xenium_cell_id": xenium_cell_id},
+                             index=pd.Index([str(k) for k in cell_keys])),
+            var=pd.DataFrame(index=pd.Index(feature_names)),
+        )
+        output = path.with_name(f"{path.name}.h5ad")
+        adata.write_h5ad(output, compression="gzip")
+        return output
+
+    output = path.with_name(f"{path.name}.zarr.zip")
+    with open_explorer_store(output, build_dir) as store:
+        matrix = store.create_group("X")
+        matrix.array("indptr", indptr, chunks=(chunk_cells + 1,), compressor=compressor)
+        matrix.array("indices", indices, compressor=compressor)
+        matrix.array("data", counts.astype(np.uint32), compressor=compressor)
+        matrix.attrs.update({"encoding-type": "csr_matrix", "encoding-version": "0.1.0", "shape": shape})
+        store.array("cell_id", cell_id, chunks=(chunk_cells, 2), compressor=compressor)
+        store.array("xenium_cell_id", xenium_cell_id.astype(np.bytes_), chunks=(chunk_cells,), compressor=compressor)
+        store.attrs.update({"feature_names": feature_names, "number_cells": shape[0]})
+    return output
+
+
 def generate_experiment_file(
     template_path: str,
     output_path: str,
@@ -449,6 +1212,86 @@ Examples:
         default=100,
         help="Maximum area threshold to include cells (default: 100)"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to build cell boundaries (default: 1)"
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Read the segmentation in row batches instead of all at once; "
+             "the parquet must be sorted by the cell ID column"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=STREAM_BATCH_ROWS,
+        help=f"Rows read per batch with --streaming (default: {STREAM_BATCH_ROWS})"
+    )
+    parser.add_argument(
+        "--max-vertices",
+        type=int,
+        default=MAX_POLYGON_VERTICES,
+        help="Vertex budget of the cell and nucleus polygons; larger polygons are simplified "
+             f"(default: {MAX_POLYGON_VERTICES})"
+    )
+    parser.add_argument(
+        "--area-tolerance",
+        type=float,
+        default=AREA_TOLERANCE,
+        help="Relative area change above which simplified cells are counted and reported "
+             f"(default: {AREA_TOLERANCE})"
+    )
+    parser.add_argument(
+        "--geometry-cache",
+        default=None,
+        help="Parquet sidecar with the per-cell geometry. It is reused when it matches the input "
+             "and settings (only the area filter is reapplied) and written otherwise (default: no cache)"
+    )
+    parser.add_argument(
+        "--count-matrix",
+        choices=COUNT_MATRIX_FORMATS,
+        default=None,
+        help="Also write a CSR cell x feature count matrix in this format, rows in cell_id order "
+             "(needs the feature_name column; default: not written)"
+    )
+    parser.add_argument(
+        "--count-matrix-filename",
+        default="cell_feature_matrix",
+        help="Filename prefix for the count matrix (default: cell_feature_matrix)"
+    )
+    parser.add_argument(
+        "--chunk-cells",
+        type=int,
+        default=ZARR_CHUNK_CELLS,
+        help=f"Number of cells per zarr chunk (default: {ZARR_CHUNK_CELLS})"
+    )
+    parser.add_argument(
+        "--compressor",
+        choices=ZARR_COMPRESSORS,
+        default="zstd",
+        help="Blosc codec for the zarr arrays (default: zstd)"
+    )
+    parser.add_argument(
+        "--compression-level",
+        type=int,
+        default=ZARR_COMPRESSION_LEVEL,
+        help=f"Blosc compression level, 1-9 (default: {ZARR_COMPRESSION_LEVEL})"
+    )
+    parser.add_argument(
+        "--compression-threads",
+        type=int,
+        default=1,
+        help="Number of threads used to compress zarr chunks (default: 1)"
+    )
+    parser.add_argument(
+        "--build-dir",
+        default=None,
+        help="Build the zarr stores in this (local) directory and zip them into the output "
+             "directory at the end (default: write the zip files directly)"
+    )
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -457,6 +1300,9 @@ Examples:
     
     args = parser.parse_args()
     
+    if args.max_vertices < 4:
+        parser.error(f"--max-vertices must be at least 4, got {args.max_vertices}")
+    
     # Validate input file
     if not args.seg_df.endswith('.parquet'):
         raise ValueError(f"Input file must be in Parquet format (*.parquet). Got: {args.seg_df}")
@@ -464,18 +1310,39 @@ Examples:
     if not Path(args.seg_df).exists():
         raise FileNotFoundError(f"Segmentation file not found: {args.seg_df}")
     
-    # Load segmentation dataframe
-    if args.verbose:
-        print(f"Loading segmentation data from {args.seg_df}...")
-    
-    try:
-        seg_df = pd.read_parquet(args.seg_df)
-    except Exception as e:
-        raise ValueError(f"Failed to read Parquet file {args.seg_df}: {e}")
+    # Reuse the cell geometry of an earlier run when the sidecar matches
+    features = args.count_matrix is not None
+    geometry = None
+    cache_key = None
+    if args.geometry_cache:
+        cache_key = geometry_cache_key(args.seg_df, args.cell_id_column, args.max_vertices)
+        geometry = read_geometry_cache(args.geometry_cache, cache_key, features=features)
+        if args.verbose:
+            if geometry is not None:
+                print(f"Reusing geometry of {geometry.num_rows:,} cells from {args.geometry_cache}")
+            else:
+                print(f"No matching geometry in {args.geometry_cache}, it will be rebuilt")
     
-    if args.verbose:
-        print(f"Loaded {len(seg_df):,} rows from segmentation dataframe")
-        print(f"Columns: {', '.join(seg_df.columns)}")
+    # Load segmentation dataframe
+    seg_df = None
+    if geometry is None:
+        if args.verbose:
+            print(f"Loading segmentation data from {args.seg_df}...")
+        
+        try:
+            if args.streaming:
+                seg_df = iter_cell_batches(args.seg_df, args.cell_id_column, args.batch_size, features)
+            else:
+                seg_df = load_segmentation(args.seg_df, args.cell_id_column, features)
+        except Exception as e:
+            raise ValueError(f"Failed to read Parquet file {args.seg_df}: {e}")
+        
+        if args.verbose:
+            if args.streaming:
+                print(f"Streaming segmentation data in batches of {args.batch_size:,} rows")
+            else:
+                print(f"Loaded {len(seg_df):,} rows from segmentation dataframe")
+                print(f"Columns: {', '.join(seg_df.columns)}")
     
     # Load analysis dataframe if provided
     analysis_df = None
@@ -516,8 +1383,15 @@ Examples:
         print(f"  Output: {args.output_dir}")
         print(f"  Cell ID column: {args.cell_id_column}")
         print(f"  Area thresholds: {args.area_low} - {args.area_high}")
+        print(f"  Workers: {args.workers}")
+        print(f"  Polygon vertex budget: {args.max_vertices}")
+        print(f"  Compression: blosc {args.compressor} level {args.compression_level}, "
+              f"{args.compression_threads} threads, {args.chunk_cells} cells per chunk")
     
     try:
+        if geometry is None and args.geometry_cache:
+            geometry = build_cell_geometry(seg_df, args.cell_id_column, args.workers, args.max_vertices, features)
+            write_geometry_cache(geometry, args.geometry_cache, cache_key)
         seg2explorer(
             seg_df=seg_df,
             source_path=args.source_path,
@@ -530,6 +1404,17 @@ Examples:
             cell_id_columns=args.cell_id_column,
             area_low=args.area_low,
             area_high=args.area_high,
+            workers=args.workers,
+            chunk_cells=args.chunk_cells,
+            compressor=args.compressor,
+            compression_level=args.compression_level,
+            compression_threads=args.compression_threads,
+            build_dir=args.build_dir,
+            max_vertices=args.max_vertices,
+            area_tolerance=args.area_tolerance,
+            geometry=geometry,
+            count_matrix=args.count_matrix,
+            count_matrix_filename=args.count_matrix_filename,
         )
     except Exception as e:
         print(f"Error during conversion: {e}", file=sys.stderr)
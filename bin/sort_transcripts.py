@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+
+"""
+Rewrite transcripts.parquet as a filtered, spatially sorted Parquet file.
+
+Transcripts are filtered once (QV and control/blank probes, as in
+filter_transcripts_parquet_v4.py) and ordered along a Hilbert (or Z-order) curve
+over the slide, so every row group covers a compact patch with tight x/y min/max
+statistics. Tile reads with an x/y filter then only touch the row groups that
+overlap the tile instead of scanning the whole slide.
+
+The sort is external: batches are spilled to bucket files by the high bits of their
+curve key (buckets are contiguous ranges of the curve), then each bucket is sorted
+in memory and appended to the output. The bucket count assumes uniform density, so a
+bucket that ends up with more than BUCKET_ROWS rows (dense tissue) is split again by
+the next bits of its keys before it is sorted.
+"""
+
+import os
+import math
+import sys
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from filter_transcripts_parquet_v4 import BATCH_SIZE, DEFAULT_EXCLUDE_PREFIXES, build_filter, drop_controls
+
+CURVE_ORDER = 16
+ROW_GROUP_SIZE = 65_536
+BUCKET_ROWS = 4_000_000
+KEY_COLUMN = '__curve_key'
+SPLIT_BITS = 2
+
+
+def hilbert_key(x, y, order=CURVE_ORDER):
+    """
+    Hilbert curve index of integer grid coordinates (vectorized xy2d).
+
+    Args:
+        x: uint64 array of grid x coordinates in [0, 2**order)
+        y: uint64 array of grid y coordinates in [0, 2**order)
+        order: Bits per axis
+
+    Returns:
+        np.ndarray: uint64 curve index of every point
+    """
+    n = np.uint64(1 << order)
+    x = x.copy()
+    y = y.copy()
+    key = np.zeros(len(x), dtype=np.uint64)
+    s = np.uint64(1 << (order - 1))
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        key += s * s * ((np.uint64(3) * rx) ^ ry).astype(np.uint64)
+        # Rotate the quadrant so the curve stays continuous
+        flip = ~ry & rx
+        x[flip] = n - np.uint64(1) - x[flip]
+        y[flip] = n - np.uint64(1) - y[flip]
+        swap = ~ry
+        x[swap], y[swap] = y[swap], x[swap]
+        s >>= np.uint64(1)
+    return key
+
+
+def zorder_key(x, y, order=CURVE_ORDER):
+    """Z-order (Morton) index of integer grid coordinates: the bits of x and y interleaved."""
+    key = np.zeros(len(x), dtype=np.uint64)
+    for bit in range(order):
+        b = np.uint64(bit)
+        key |= ((x >> b) & np.uint64(1)) << np.uint64(2 * bit)
+        key |= ((y >> b) & np.uint64(1)) << np.uint64(2 * bit + 1)
+    return key
+
+
+def slide_bounds(parquet_file):
+    """
+    Bounding box of x_location / y_location from the footer statistics,
+    falling back to a scan of the two columns when statistics are missing.
+
+    Returns:
+        tuple: (x_min, x_max, y_min, y_max)
+    """
+    metadata = parquet_file.metadata
+    names = metadata.schema.names
+    bounds = {}
+    for col in ('x_location', 'y_location'):
+        idx = names.index(col)
+        lo, hi = np.inf, -np.inf
+        for rg in range(metadata.num_row_groups):
+            stats = metadata.row_group(rg).column(idx).statistics
+            if stats is None or not stats.has_min_max:
+                break
+            lo, hi = min(lo, stats.min), max(hi, stats.max)
+        else:
+            bounds[col] = (lo, hi)
+
+    if len(bounds) < 2:
+        lo = {'x_location': np.inf, 'y_location': np.inf}
+        hi = {'x_location': -np.inf, 'y_location': -np.inf}
+        for batch in parquet_file.iter_batches(batch_size=BATCH_SIZE, columns=list(lo)):
+            for col in lo:
+                minmax = pc.min_max(batch.column(col)).as_py()
+                if minmax['min'] is not None:
+                    lo[col] = min(lo[col], minmax['min'])
+                    hi[col] = max(hi[col], minmax['max'])
+        bounds = {col: (lo[col], hi[col]) for col in lo}
+
+    return bounds['x_location'] + bounds['y_location']
+
+
+def curve_keys(batch, bounds, curve='hilbert', order=CURVE_ORDER):
+    """Quantize the transcript coordinates of `batch` onto a 2**order grid over `bounds` and return their curve keys."""
+    x_min, x_max, y_min, y_max = bounds
+    cells = float((1 << order) - 1)
+    x = batch.column('x_location').to_numpy(zero_copy_only=False)
+    y = batch.column('y_location').to_numpy(zero_copy_only=False)
+    gx = np.clip((x - x_min) / max(x_max - x_min, 1e-9) * cells, 0, cells).astype(np.uint64)
+    gy = np.clip((y - y_min) / max(y_max - y_min, 1e-9) * cells, 0, cells).astype(np.uint64)
+    return hilbert_key(gx, gy, order) if curve == 'hilbert' else zorder_key(gx, gy, order)
+
+
+def route_batch(batch, buckets, paths, writers):
+    """
+    Append the rows of `batch` to the bucket files given by `buckets` (one index per row).
+
+    Args:
+        batch: RecordBatch with the curve key column
+        buckets: int64 bucket index of every row
+        paths: Bucket file path per bucket index
+        writers: Open IPC writers by bucket index (new ones are added)
+    """
+    order = np.argsort(buckets, kind='stable')
+    batch = batch.take(pa.array(order))
+    edges = np.searchsorted(buckets[order], np.arange(len(paths) + 1))
+    for bucket in np.flatnonzero(np.diff(edges)):
+        if bucket not in writers:
+            writers[bucket] = pa.ipc.new_file(paths[bucket], batch.schema)
+        writers[bucket].write_batch(batch.slice(edges[bucket], edges[bucket + 1] - edges[bucket]))
+
+
+def spill_buckets(scanner, bounds, bucket_bits, spill_dir, curve='hilbert', exclude_prefixes=()):
+    """
+    Filter the scanned batches and append each row to the bucket file of its curve range.
+
+    Returns:
+        tuple: (list of bucket file paths, number of rows spilled)
+    """
+    n_buckets = 1 << bucket_bits
+    shift = np.uint64(2 * CURVE_ORDER - bucket_bits)
+    paths = [os.path.join(spill_dir, f"bucket_{i}.arrow") for i in range(n_buckets)]
+    writers = {}
+    rows = 0
+    try:
+        for batch in scanner.to_batches():
+            batch = drop_controls(batch, exclude_prefixes)
+            if batch.num_rows == 0:
+                continue
+            keys = curve_keys(batch, bounds, curve)
+            batch = pa.RecordBatch.from_arrays(batch.columns + [pa.array(keys)],
+                                               names=batch.schema.names + [KEY_COLUMN])
+            route_batch(batch, (keys >> shift).astype(np.int64), paths, writers)
+            rows += batch.num_rows
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return [paths[b] for b in sorted(writers)], rows
+
+
+def bucket_rows(path):
+    """Number of rows in a bucket file (read from the memory-mapped batch headers)."""
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+def split_bucket(path, shift, split_bits=SPLIT_BITS):
+    """
+    Split a bucket file by the `split_bits` curve key bits just below its own range.
+
+    All keys of a bucket share the bits above `shift + split_bits`, so the sub-buckets
+    are contiguous, ordered ranges of the bucket. The bucket file is removed.
+
+    Args:
+        path: Bucket file
+        shift: Bit position of the lowest key bit that selects the sub-bucket
+        split_bits: Number of key bits used to split
+
+    Returns:
+        list: Paths of the non-empty sub-buckets, in curve order
+    """
+    n_buckets = 1 << split_bits
+    paths = [f"{path}.{i}" for i in range(n_buckets)]
+    writers = {}
+    try:
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                keys = batch.column(KEY_COLUMN).to_numpy()
+                sub = ((keys >> np.uint64(shift)) & np.uint64(n_buckets - 1)).astype(np.int64)
+                route_batch(batch, sub, paths, writers)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    os.remove(path)
+    return [paths[b] for b in sorted(writers)]
+
+
+def write_sorted(bucket_paths, output, shift, row_group_size=ROW_GROUP_SIZE, max_rows=BUCKET_ROWS):
+    """
+    Sort every bucket by curve key and append it to `output` in row groups of `row_group_size`.
+
+    Buckets with more than `max_rows` rows are split (split_bucket) until they fit or
+    their keys cannot be split further, so no more than about `max_rows` rows are
+    sorted in memory at once, whatever the spatial density.
+
+    Args:
+        bucket_paths: Bucket files in curve order
+        output: Path for the sorted parquet
+        shift: Bit position of the lowest key bit that selects a bucket
+        row_group_size: Rows per output row group
+        max_rows: Largest bucket sorted in memory
+
+    Returns:
+        int: Number of row groups written
+    """
+    pending = [(path, shift) for path in bucket_paths]
+    writer = None
+    try:
+        while pending:
+            path, bucket_shift = pending.pop(0)
+            if bucket_shift >= SPLIT_BITS and bucket_rows(path) > max_rows:
+                sub_shift = bucket_shift - SPLIT_BITS
+                pending[:0] = [(sub_path, sub_shift) for sub_path in split_bucket(path, sub_shift)]
+                continue
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+            table = table.take(pc.sort_indices(table.column(KEY_COLUMN)))
+            table = table.drop([KEY_COLUMN])
+            if writer is None:
+                writer = pq.ParquetWriter(output, table.schema, write_statistics=True)
+            writer.write_table(table, row_group_size=row_group_size)
+            os.remove(path)
+    finally:
+        if writer is not None:
+            writer.close()
+    return pq.ParquetFile(output).metadata.num_row_groups if writer is not None else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Filter transcripts.parquet once and rewrite it sorted along a space-filling curve"
+    )
+    parser.add_argument("input", help="path to the Xenium transcripts.parquet")
+    parser.add_argument("output", help="path for the sorted transcripts parquet")
+    parser.add_argument(
+        "--curve", choices=["hilbert", "zorder"], default="hilbert",
+        help="space-filling curve used to order the transcripts (default: hilbert)"
+    )
+    parser.add_argument(
+        "--row_group_size", type=int, default=ROW_GROUP_SIZE,
+        help=f"rows per output row group; smaller groups give tighter x/y statistics (default: {ROW_GROUP_SIZE})"
+    )
+    parser.add_argument(
+        "--min_qv", type=float, default=20.0,
+        help="minimum Q-Score kept in the cache (default: 20.0)"
+    )
+    parser.add_argument(
+        "--exclude_prefixes", default=DEFAULT_EXCLUDE_PREFIXES,
+        type=lambda value: [p for p in value.split(',') if p],
+        help=f"comma-separated feature_name prefixes to drop (default: {DEFAULT_EXCLUDE_PREFIXES})"
+    )
+    args = parser.parse_args()
+
+    parquet_file = pq.ParquetFile(args.input)
+    bounds = slide_bounds(parquet_file)
+    if not np.all(np.isfinite(bounds)):
+        print(f"Error: No transcript coordinates found in {args.input}", file=sys.stderr)
+        sys.exit(1)
+
+    # Enough buckets that each one sorts in memory (bucket bits must be even to split both axes)
+    n_buckets = max(1, parquet_file.metadata.num_rows // BUCKET_ROWS)
+    bucket_bits = min(2 * CURVE_ORDER, 2 * math.ceil(math.log(n_buckets, 4))) if n_buckets > 1 else 0
+
+    dataset = ds.dataset(args.input, format=ds.ParquetFileFormat(
+        read_options=ds.ParquetReadOptions(dictionary_columns=["feature_name"])
+    ))
+    scanner = dataset.scanner(filter=build_filter(args.min_qv), batch_size=BATCH_SIZE)
+
+    spill_dir = tempfile.mkdtemp(prefix='sort_transcripts_', dir=os.path.dirname(os.path.abspath(args.output)))
+    try:
+        bucket_paths, rows = spill_buckets(scanner, bounds, bucket_bits, spill_dir, args.curve, args.exclude_prefixes)
+        if rows == 0:
+            print(f"Error: No transcripts left in {args.input} after filtering", file=sys.stderr)
+            sys.exit(1)
+        row_groups = write_sorted(bucket_paths, args.output, 2 * CURVE_ORDER - bucket_bits, args.row_group_size)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    print(f"Wrote {rows} transcripts in {row_groups} {args.curve}-sorted row groups to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,84 @@
 #!/usr/bin/env python3
 import argparse
+import math
+import sys
+import numpy as np
 import pandas as pd
+import pyarrow.dataset as ds
+from filter_transcripts_parquet_v4 import DEFAULT_EXCLUDE_PREFIXES, build_filter, drop_controls
+
+
+class NoTranscriptsError(ValueError):
+    """Raised when the QV / control-probe filters leave no transcripts to tile."""
+
+    def __init__(self, path, min_qv, exclude_prefixes):
+        super().__init__(f"No transcripts left in {path} after filtering "
+                         f"(min_qv {min_qv}, excluded prefixes {','.join(exclude_prefixes) or 'none'})")
+
+
+class KLLSketch:
+    """
+    Streaming quantile sketch (KLL) with ~`eps` normalized rank error.
+
+    Values are buffered in levels of compactors; when a level overflows it is sorted
+    and every other item is promoted to the next level with double the weight.
+    Memory is O(1/eps) regardless of how many values are added.
+    """
+
+    def __init__(self, eps: float = 0.001, c: float = 2 / 3, seed: int = 0):
+        # Rank error is ~2/k in practice
+        self.k = max(8, math.ceil(2.0 / eps))
+        self.c = c
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, math.ceil(self.k * self.c ** depth))
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) <= self._capacity(level):
+                level += 1
+                continue
+            grew = level + 1 == len(self.levels)
+            if grew:
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            # an odd item out stays behind at this level
+            n_even = len(items) - len(items) % 2
+            self.levels[level] = items[n_even:]
+            promoted = items[self.rng.integers(2):n_even:2]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            # a new top level shrinks the capacity of every level below it
+            level = 0 if grew else level + 1
+
+    def quantiles(self, qs) -> np.ndarray:
+        qs = np.asarray(qs, dtype=np.float64)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        cum_weights = np.cumsum(weights[order])
+        idx = np.minimum(np.searchsorted(cum_weights, qs * cum_weights[-1]), len(values) - 1)
+        # the extremes are tracked exactly so the outer tiles cover every transcript
+        return np.where(qs <= 0, self.min, np.where(qs >= 1, self.max, values[idx]))
+
 
 def compute_quantile_ranges(df: pd.DataFrame, col: str, n_bins: int):
     """
@@ -9,10 +87,148 @@ def compute_quantile_ranges(df: pd.DataFrame, col: str, n_bins: int):
     """
     # qcut with retbins=True gives you the edges of each quantile bin
     _, bins = pd.qcut(df[col], q=n_bins, retbins=True, duplicates='drop')
+    return edges_to_ranges(bins)
+
+def edges_to_ranges(bins):
     # build [(min1, max1), (min2, max2), ...]
     ranges = [(bins[i], bins[i+1]) for i in range(len(bins)-1)]
     return ranges
 
+def filtered_coordinates(path: str, min_qv: float, exclude_prefixes, batch_size: int = 1_000_000):
+    """
+    Yield the (x, y) coordinates of the transcripts that FILTER_TRANSCRIPTS keeps
+    (QV threshold and control/blank probes), in batches, reading only the columns
+    the filters and coordinates need.
+    """
+    dataset = ds.dataset(path, format=ds.ParquetFileFormat(
+        read_options=ds.ParquetReadOptions(dictionary_columns=['feature_name'])
+    ))
+    scanner = dataset.scanner(columns=['x_location', 'y_location', 'feature_name'],
+                              filter=build_filter(min_qv), batch_size=batch_size)
+    for batch in scanner.to_batches():
+        batch = drop_controls(batch, exclude_prefixes)
+        if batch.num_rows:
+            yield (batch.column('x_location').to_numpy(zero_copy_only=False),
+                   batch.column('y_location').to_numpy(zero_copy_only=False))
+
+def load_coordinates(path: str, min_qv: float, exclude_prefixes) -> pd.DataFrame:
+    """
+    x_location / y_location of the filtered transcripts (see filtered_coordinates) as a DataFrame.
+
+    Raises:
+        NoTranscriptsError: if no transcript passes the filters
+    """
+    batches = list(filtered_coordinates(path, min_qv, exclude_prefixes))
+    df = pd.DataFrame({
+        'x_location': np.concatenate([x for x, _ in batches]) if batches else np.empty(0),
+        'y_location': np.concatenate([y for _, y in batches]) if batches else np.empty(0),
+    }).dropna()
+    if df.empty:
+        raise NoTranscriptsError(path, min_qv, exclude_prefixes)
+    return df
+
+def stream_quantile_ranges(path: str, x_bins: int, y_bins: int, eps: float, min_qv: float,
+                           exclude_prefixes, batch_size: int = 1_000_000):
+    """
+    Compute x and y quantile ranges of the filtered transcripts in one streamed pass
+    over the parquet file. Edges have ~`eps` rank error. Raises NoTranscriptsError
+    if no transcript passes the filters.
+    """
+    x_sketch = KLLSketch(eps)
+    y_sketch = KLLSketch(eps, seed=1)
+    for x, y in filtered_coordinates(path, min_qv, exclude_prefixes, batch_size):
+        x_sketch.update(x)
+        y_sketch.update(y)
+    if x_sketch.n == 0:
+        raise NoTranscriptsError(path, min_qv, exclude_prefixes)
+
+    x_edges = np.unique(x_sketch.quantiles(np.linspace(0, 1, x_bins + 1)))
+    y_edges = np.unique(y_sketch.quantiles(np.linspace(0, 1, y_bins + 1)))
+    return edges_to_ranges(x_edges), edges_to_ranges(y_edges)
+
+def stream_density_grid(path: str, resolution: int, min_qv: float, exclude_prefixes,
+                        batch_size: int = 1_000_000):
+    """
+    Build a resolution x resolution count histogram of the filtered transcripts (the
+    rows FILTER_TRANSCRIPTS keeps, so tiles are balanced on what Baysor receives) in
+    two streamed, column-projected passes (bounds, then counts). Returns
+    (x, y, counts, bounds) with one entry per non-empty bin, located at the bin centre.
+    Raises NoTranscriptsError if no transcript passes the filters.
+    """
+    x_min = y_min = math.inf
+    x_max = y_max = -math.inf
+    for x, y in filtered_coordinates(path, min_qv, exclude_prefixes, batch_size):
+        x_min, x_max = min(x_min, float(np.nanmin(x))), max(x_max, float(np.nanmax(x)))
+        y_min, y_max = min(y_min, float(np.nanmin(y))), max(y_max, float(np.nanmax(y)))
+    if not (math.isfinite(x_min) and math.isfinite(y_min)):
+        raise NoTranscriptsError(path, min_qv, exclude_prefixes)
+
+    x_edges = np.linspace(x_min, x_max, resolution + 1)
+    y_edges = np.linspace(y_min, y_max, resolution + 1)
+    counts = np.zeros((resolution, resolution), dtype=np.int64)
+    for x, y in filtered_coordinates(path, min_qv, exclude_prefixes, batch_size):
+        hist, _, _ = np.histogram2d(x, y, bins=[x_edges, y_edges])
+        counts += hist.astype(np.int64)
+
+    ix, iy = np.nonzero(counts)
+    x_centres = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centres = (y_edges[:-1] + y_edges[1:]) / 2
+    return x_centres[ix], y_centres[iy], counts[ix, iy], (x_min, x_max, y_min, y_max)
+
+def median_split(values: np.ndarray, weights: np.ndarray):
+    """
+    Coordinate splitting `values` into two halves of ~equal weight, placed midway
+    between two neighbouring distinct values. None if all values are equal.
+    """
+    order = np.argsort(values, kind='stable')
+    values = values[order]
+    cum_weights = np.cumsum(weights[order])
+    i = min(int(np.searchsorted(cum_weights, cum_weights[-1] / 2)), len(values) - 1)
+    above = np.flatnonzero(values > values[i])
+    if len(above):
+        return (values[i] + values[above[0]]) / 2
+    below = np.flatnonzero(values < values[i])
+    if len(below):
+        return (values[below[-1]] + values[i]) / 2
+    return None
+
+def kd_tiles(x: np.ndarray, y: np.ndarray, weights: np.ndarray, bounds, target: int):
+    """
+    Recursively bisect space at the weighted median of the longer side (KD-tree style)
+    until every tile holds at most `target` transcripts.
+
+    Returns a tiles DataFrame (tile_id, x_min, x_max, y_min, y_max) and the
+    predicted transcript count per tile.
+    """
+    leaves = []
+
+    def bisect(idx, x_min, x_max, y_min, y_max):
+        total = weights[idx].sum()
+        if total > target and len(idx) > 1:
+            axes = [('x', x), ('y', y)] if (x_max - x_min) >= (y_max - y_min) else [('y', y), ('x', x)]
+            for axis, coords in axes:
+                split = median_split(coords[idx], weights[idx])
+                if split is None:
+                    continue
+                low = coords[idx] < split
+                if axis == 'x':
+                    bisect(idx[low], x_min, split, y_min, y_max)
+                    bisect(idx[~low], split, x_max, y_min, y_max)
+                else:
+                    bisect(idx[low], x_min, x_max, y_min, split)
+                    bisect(idx[~low], x_min, x_max, split, y_max)
+                return
+        # small enough, or every point shares one location
+        leaves.append(((x_min, x_max, y_min, y_max), int(total)))
+
+    bisect(np.arange(len(x)), *bounds)
+
+    tiles = pd.DataFrame([
+        {'tile_id': str(i), 'x_min': b[0], 'x_max': b[1], 'y_min': b[2], 'y_max': b[3]}
+        for i, (b, _) in enumerate(leaves, start=1)
+    ])
+    return tiles, np.array([count for _, count in leaves])
+
 def make_tiles(df: pd.DataFrame, x_bins: int, y_bins: int):
     """
     Produce a DataFrame with one row per tile:
@@ -20,7 +236,10 @@ def make_tiles(df: pd.DataFrame, x_bins: int, y_bins: int):
     """
     x_ranges = compute_quantile_ranges(df, 'x_location', x_bins)
     y_ranges = compute_quantile_ranges(df, 'y_location', y_bins)
-    
+    return tiles_from_ranges(x_ranges, y_ranges)
+
+def tiles_from_ranges(x_ranges, y_ranges):
+    """Cartesian product of x and y ranges as a tiles DataFrame."""
     tiles = []
     for ix, (x_min, x_max) in enumerate(x_ranges, start=1):
         for iy, (y_min, y_max) in enumerate(y_ranges, start=1):
@@ -47,13 +266,70 @@ def main():
         "--y_bins", type=int, default=10,
         help="number of slices along the y axis (default: 10)"
     )
+    parser.add_argument(
+        "--strategy", choices=["grid", "kd"], default="grid",
+        help="grid: x quantiles x y quantiles (--x_bins/--y_bins); kd: recursive "
+             "bisection until each tile holds at most --target_transcripts (default: grid)"
+    )
+    parser.add_argument(
+        "--target_transcripts", type=int, default=400_000,
+        help="maximum transcripts per tile for --strategy kd (default: 400000)"
+    )
+    parser.add_argument(
+        "--density_resolution", type=int, default=1024,
+        help="bins per axis of the density grid used by --strategy kd --streaming (default: 1024)"
+    )
+    parser.add_argument(
+        "--streaming", action="store_true",
+        help="estimate tile edges with a streaming quantile sketch, reading only "
+             "x_location/y_location in batches (constant memory)"
+    )
+    parser.add_argument(
+        "--quantile_error", type=float, default=0.001,
+        help="normalized rank error of the streaming sketch (default: 0.001)"
+    )
+    parser.add_argument(
+        "--min_qv", type=float, default=20.0,
+        help="minimum Q-Score; tiles are computed on the transcripts FILTER_TRANSCRIPTS keeps (default: 20.0)"
+    )
+    parser.add_argument(
+        "--exclude_prefixes", default=DEFAULT_EXCLUDE_PREFIXES,
+        type=lambda value: [p for p in value.split(',') if p],
+        help=f"comma-separated feature_name prefixes dropped before tiling (default: {DEFAULT_EXCLUDE_PREFIXES})"
+    )
     args = parser.parse_args()
 
-    # 1) load
-    df = pd.read_parquet(args.input, engine='fastparquet')
+    try:
+        if args.strategy == "kd":
+            if args.streaming:
+                # 1) stream coordinates into a density grid
+                x, y, weights, bounds = stream_density_grid(args.input, args.density_resolution,
+                                                            args.min_qv, args.exclude_prefixes)
+            else:
+                # 1) load the coordinates of the filtered transcripts only
+                df = load_coordinates(args.input, args.min_qv, args.exclude_prefixes)
+                x, y = df['x_location'].to_numpy(), df['y_location'].to_numpy()
+                weights = np.ones(len(x), dtype=np.int64)
+                bounds = (x.min(), x.max(), y.min(), y.max())
+
+            # 2) compute tiles
+            tiles_df, counts = kd_tiles(x, y, weights, bounds, args.target_transcripts)
+            print(f"Predicted transcripts per tile: min {counts.min()}, max {counts.max()}, "
+                  f"imbalance ratio (max/mean) {counts.max() / counts.mean():.2f}")
+        elif args.streaming:
+            # 1+2) stream coordinates and compute tiles
+            x_ranges, y_ranges = stream_quantile_ranges(args.input, args.x_bins, args.y_bins, args.quantile_error,
+                                                        args.min_qv, args.exclude_prefixes)
+            tiles_df = tiles_from_ranges(x_ranges, y_ranges)
+        else:
+            # 1) load the coordinates of the filtered transcripts
+            df = load_coordinates(args.input, args.min_qv, args.exclude_prefixes)
 
-    # 2) compute tiles
-    tiles_df = make_tiles(df, args.x_bins, args.y_bins)
+            # 2) compute tiles
+            tiles_df = make_tiles(df, args.x_bins, args.y_bins)
+    except NoTranscriptsError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
 
     # 3) save
     tiles_df.to_csv(args.output_csv, index=False)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+"""
+Script to resolve halo overlaps between Baysor tiles before reconstruction.
+
+Tiles segmented with a halo margin carry an `is_core` column (1 = core, 0 = halo).
+A cell is owned by a tile when the centroid of its transcripts in that tile lies in
+the tile's core, with the same half-open edges as the is_core tagging, so a cell seen
+by two tiles (e.g. split 50/50 across their shared edge) has at most one owner.
+For every tile this keeps:
+  - all core transcripts of owned cells,
+  - halo transcripts of owned cells, unless they are core transcripts of a cell owned
+    by their own tile; among several tiles claiming the same halo transcript the
+    lowest tile index wins,
+  - the other core transcripts with the cell cleared, unless a neighbouring tile
+    claimed them,
+and drops everything else, so every transcript is written once.
+Polygons of cells that the tile does not own are removed from its polygon GeoParquet.
+"""
+
+import os
+import shutil
+import sys
+import argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from cell_id_codec import cell_id_numbers
+from filter_transcripts_parquet_v4 import core_mask
+from polygon_parquet import CELL_COLUMN, read_polygons, write_polygons
+
+EMPTY_CELLS = ['', 'NA', 'null', 'None']
+TILE_SUFFIX = '_segmentation.csv'
+
+
+def has_core_column(csv_path):
+    """Check whether a tile CSV was produced with a halo (skipped tiles are not)."""
+    with open(csv_path, 'r') as f:
+        return 'is_core' in f.readline().rstrip('\r\n').split(',')
+
+
+def read_splits(splits_path):
+    """
+    Read the tile bounds of a splits CSV.
+
+    Returns:
+        tuple: (dict tile_id -> bounds dict, dict of the overall x_max / y_max)
+    """
+    splits = pd.read_csv(splits_path, dtype={'tile_id': str})
+    tiles = {row.tile_id: {'x_min': row.x_min, 'x_max': row.x_max, 'y_min': row.y_min, 'y_max': row.y_max}
+             for row in splits.itertuples()}
+    outer = {'x_max': splits['x_max'].max(), 'y_max': splits['y_max'].max()}
+    return tiles, outer
+
+
+def tile_id_of(csv_path):
+    """Tile ID of a "<tile_id>_segmentation.csv" Baysor output."""
+    name = os.path.basename(csv_path)
+    return name[:-len(TILE_SUFFIX)] if name.endswith(TILE_SUFFIX) else name
+
+
+def find_owned_cells(csv_path, tile, outer, cell_col='cell'):
+    """
+    Find the cells owned by a tile: the cells whose centroid lies in the tile core.
+
+    Args:
+        csv_path: Path to a Baysor segmentation CSV with an is_core column
+        tile: Bounds of the tile (x_min, x_max, y_min, y_max)
+        outer: Overall x_max / y_max of the tiling (see core_mask)
+        cell_col: Name of the cell column (default: 'cell')
+
+    Returns:
+        tuple: (set of owned cell values, Series of their core transcript_ids,
+        Series of their halo transcript_ids)
+    """
+    df = pd.read_csv(csv_path, usecols=['transcript_id', cell_col, 'is_core', 'x', 'y'],
+                     dtype={'transcript_id': str, cell_col: str, 'is_core': str}, keep_default_na=False)
+    df = df[~df[cell_col].isin(EMPTY_CELLS)]
+    if df.empty:
+        return set(), pd.Series([], dtype=str), pd.Series([], dtype=str)
+
+    centroids = df.groupby(cell_col)[['x', 'y']].mean()
+    in_core = core_mask(pa.table({'x_location': centroids['x'].to_numpy(),
+                                  'y_location': centroids['y'].to_numpy()}), tile, outer)
+    owned = set(centroids.index[in_core.to_numpy(zero_copy_only=False)])
+
+    rows = df[df[cell_col].isin(owned)]
+    is_core = rows['is_core'] == '1'
+    return owned, rows.loc[is_core, 'transcript_id'], rows.loc[~is_core, 'transcript_id']
+
+
+def resolve_ownership(csv_paths, tiles, outer, cell_col='cell'):
+    """
+    Find the owned cells of every tile and which tile keeps each claimed halo transcript.
+
+    Halo transcripts that are core transcripts of a cell owned by their own tile stay
+    there; the others go to the lowest-index tile claiming them.
+
+    Args:
+        csv_paths: Tile segmentation CSVs (None for tiles without an is_core column)
+        tiles: Bounds of every tile, in the same order
+        outer: Overall x_max / y_max of the tiling
+        cell_col: Name of the cell column (default: 'cell')
+
+    Returns:
+        tuple: (list of owned cell sets (None for untagged tiles),
+        dict transcript_id -> index of the tile that keeps it as a halo transcript)
+    """
+    owned_per_tile = []
+    owned_core = set()
+    claims_per_tile = []
+    for tile_idx, (csv_path, tile) in enumerate(zip(csv_paths, tiles)):
+        if csv_path is None:
+            owned_per_tile.append(None)
+            claims_per_tile.append(())
+            continue
+        owned, core, claimed = find_owned_cells(csv_path, tile, outer, cell_col)
+        owned_per_tile.append(owned)
+        owned_core.update(core)
+        claims_per_tile.append(claimed)
+        print(f"Tile {tile_idx} ({csv_path}): owns {len(owned)} cells, "
+              f"claims {len(claimed)} halo transcripts", file=sys.stderr)
+
+    halo_claims = {}
+    for tile_idx, claimed in enumerate(claims_per_tile):
+        for transcript_id in claimed:
+            if transcript_id not in owned_core:
+                halo_claims.setdefault(transcript_id, tile_idx)
+    return owned_per_tile, halo_claims
+
+
+def trim_csv(csv_path, output_path, owned, halo_claims, tile_idx, cell_col='cell'):
+    """
+    Write the rows of one tile that survive halo resolution (see module docstring).
+
+    Args:
+        csv_path: Path to the tile segmentation CSV
+        output_path: Path for the trimmed CSV (written without the is_core column)
+        owned: Set of cell values owned by this tile
+        halo_claims: dict transcript_id -> index of the tile that keeps it as a halo
+            transcript (see resolve_ownership)
+        tile_idx: Index of this tile
+        cell_col: Name of the cell column (default: 'cell')
+
+    Returns:
+        tuple: (kept_count, removed_count)
+    """
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+
+    is_core = df['is_core'] == '1'
+    is_owned = df[cell_col].isin(owned)
+    claim = df['transcript_id'].map(halo_claims)
+
+    # Core rows of owned cells always stay (they are never claimed), other core rows
+    # unless another tile claimed them, and halo rows only where this tile won the claim
+    keep = (is_core & (is_owned | claim.isna())) | (is_owned & ~is_core & (claim == tile_idx))
+    # Core rows of cells owned by another tile stay as unassigned transcripts
+    df.loc[keep & is_core & ~is_owned, cell_col] = ''
+
+    df = df.loc[keep].drop(columns=['is_core'])
+    df.to_csv(output_path, index=False)
+    return int(keep.sum()), int((~keep).sum())
+
+
+def trim_polygons(polygons_path, output_path, owned):
+    """
+    Keep only the polygons of owned cells.
+
+    Args:
+        polygons_path: Path to the tile polygon GeoParquet
+        output_path: Path for the trimmed polygons
+        owned: Set of cell values ("PREFIX-id") owned by the tile
+    """
+    table = read_polygons(polygons_path)
+    owned_cells = pa.array(sorted(owned), type=pa.string())
+    owned_ids = cell_id_numbers(owned_cells, pc.is_valid(owned_cells)).drop_null()
+    write_polygons(table.filter(pc.is_in(table.column(CELL_COLUMN), value_set=owned_ids)), output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Resolve halo overlaps between Baysor tiles (keep core-owned assignments only)'
+    )
+    parser.add_argument(
+        '--csv',
+        nargs='+',
+        required=True,
+        help='Tile segmentation CSV files'
+    )
+    parser.add_argument(
+        '--polygons',
+        nargs='+',
+        required=True,
+        help='Tile polygon GeoParquet files, in the same order as --csv'
+    )
+    parser.add_argument(
+        '--splits',
+        required=True,
+        help='Splits CSV with the tile bounds (tile_id, x_min, x_max, y_min, y_max); '
+             f'tiles are matched by their <tile_id>{TILE_SUFFIX} file name'
+    )
+    parser.add_argument(
+        '--outdir',
+        required=True,
+        help='Directory for the trimmed files (same file names as the inputs)'
+    )
+    parser.add_argument(
+        '--cell-column',
+        default='cell',
+        help='Name of the cell column in CSV (default: cell)'
+    )
+
+    args = parser.parse_args()
+
+    if len(args.csv) != len(args.polygons):
+        print("Error: --csv and --polygons must list the same number of files", file=sys.stderr)
+        sys.exit(1)
+
+    os.makedirs(args.outdir, exist_ok=True)
+
+    # Skipped (header-only) tiles have no is_core column and are copied through as-is
+    tagged = [has_core_column(csv_path) for csv_path in args.csv]
+
+    tile_bounds, outer = read_splits(args.splits)
+    tiles = []
+    for csv_path, is_tagged in zip(args.csv, tagged):
+        if is_tagged and tile_id_of(csv_path) not in tile_bounds:
+            print(f"Error: Tile {tile_id_of(csv_path)} of {csv_path} is not in {args.splits}", file=sys.stderr)
+            sys.exit(1)
+        tiles.append(tile_bounds.get(tile_id_of(csv_path)))
+
+    # Pass 1: ownership per tile and the tile that keeps every claimed halo transcript
+    owned_per_tile, halo_claims = resolve_ownership(
+        [csv_path if is_tagged else None for csv_path, is_tagged in zip(args.csv, tagged)],
+        tiles, outer, args.cell_column
+    )
+
+    # Pass 2: write trimmed tiles
+    for tile_idx, (csv_path, polygons_path) in enumerate(zip(args.csv, args.polygons)):
+        if not tagged[tile_idx]:
+            shutil.copyfile(csv_path, os.path.join(args.outdir, os.path.basename(csv_path)))
+            shutil.copyfile(polygons_path, os.path.join(args.outdir, os.path.basename(polygons_path)))
+            continue
+        owned = owned_per_tile[tile_idx]
+        kept, removed = trim_csv(csv_path, os.path.join(args.outdir, os.path.basename(csv_path)),
+                                 owned, halo_claims, tile_idx, args.cell_column)
+        trim_polygons(polygons_path, os.path.join(args.outdir, os.path.basename(polygons_path)), owned)
+        print(f"Tile {tile_idx}: kept {kept} rows, removed {removed} halo/duplicate rows", file=sys.stderr)
+
+    print(f"Trimmed tiles written to {args.outdir}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,15 +15,17 @@ include { IMPORT_SEGMENTATION      } from './modules/IMPORT_SEGMENTATION/main'
 //Baysor
 include { CALC_SPLITS              } from './modules/CALC_SPLITS/main'
 include { FILTER_TRANSCRIPTS       } from './modules/BAYSOR/FILTER_TRANSCRIPTS/main'
+include { PARTITION_TRANSCRIPTS    } from './modules/BAYSOR/PARTITION_TRANSCRIPTS/main'
+include { SORT_TRANSCRIPTS         } from './modules/BAYSOR/SORT_TRANSCRIPTS/main'
 include { BAYSOR_RUN               } from './modules/BAYSOR/BAYSOR_RUN/main'
 include { RECONSTRUCT_SEGMENTATION } from './modules/BAYSOR/RECONSTRUCT_SEGMENTATION/main'
-include { FILTER_POLYGONS          } from './modules/BAYSOR/FILTER_POLYGONS'
 
 //Segger
 include { SEGGER_TRAIN             } from './modules/segger/train/main'
 include { SEGGER_PREDICT           } from './modules/segger/predict/main'
 include { SEGGER_CREATE_DATASET    } from './modules/segger/create_dataset/main'
 include { SEGGER_EXPLORER          } from './modules/segger/explorer/main'
+include { SEGGER_EXPLORER_GEOMETRY } from './modules/segger/explorer_geometry/main'
 // include { PARQUET_TO_CSV        } from './modules/spatialconverter/parquet_to_csv/main'
 
 /*
@@ -40,39 +42,60 @@ workflow BAYSOR_PARALLEL {
 
     main:
 
-        // Set splits.csv into tuple queue channel
-        Channel
-            ch_splits_csv
-            .flatMap { meta, splits_file ->
-                splits_file.splitCsv(header: true).collect { row ->
-                    tuple(meta, row.tile_id, row.x_min, row.x_max, row.y_min, row.y_max)
+        if (params.baysor_single_pass) {
+            // Scan transcripts once and write every tile, then fan out from the manifest
+            PARTITION_TRANSCRIPTS(ch_transcripts_parquet.join(ch_splits_csv, by: 0))
+
+            PARTITION_TRANSCRIPTS.out.partitioned
+                .flatMap { meta, manifest, tile_files ->
+                    def files_by_name = (tile_files instanceof List ? tile_files : [tile_files]).collectEntries { [(it.name): it] }
+                    manifest.splitCsv(header: true).collect { row ->
+                        tuple(meta, row.tile_id, files_by_name[row.file], row.n_transcripts as Integer)
+                    }
                 }
-            }
-            .set { ch_splits } // channel: [ val(tile_id), val(x_min), val(x_max), val(y_min), val(y_max) ]
+                .set { ch_transcripts_filtered } // channel: [ val(meta), val(tile_id), path(tile_file), val(row_count) ]
+        }
+        else {
+            // Set splits.csv into tuple queue channel
+            Channel
+                ch_splits_csv
+                .flatMap { meta, splits_file ->
+                    def rows = splits_file.splitCsv(header: true)
+                    // Outer edges of the whole tiling: only tile edges on them keep a closed halo core
+                    def outer_x_max = rows.collect { it.x_max as Double }.max()
+                    def outer_y_max = rows.collect { it.y_max as Double }.max()
+                    rows.collect { row ->
+                        tuple(meta, row.tile_id, row.x_min, row.x_max, row.y_min, row.y_max, outer_x_max, outer_y_max)
+                    }
+                }
+                .set { ch_splits } // channel: [ val(meta), val(tile_id), val(x_min), val(x_max), val(y_min), val(y_max), val(outer_x_max), val(outer_y_max) ]
 
-        //Add in sample path for each split value
-        transcripts_input = ch_transcripts_parquet.combine(ch_splits, by: 0)
+            //Add in sample path for each split value
+            transcripts_input = ch_transcripts_parquet.combine(ch_splits, by: 0)
 
-        // Process and split transcripts file for Baysor
-        FILTER_TRANSCRIPTS(transcripts_input)
+            // Process and split transcripts file for Baysor (one full scan per tile)
+            FILTER_TRANSCRIPTS(transcripts_input)
+            ch_transcripts_filtered = FILTER_TRANSCRIPTS.out.transcripts_filtered
+                .map { meta, tile_id, tile_file, count_file ->
+                    tuple(meta, tile_id, tile_file, count_file.text.trim() as Integer)
+                }
+        }
 
         //Baysor run in chunked parallel
-        BAYSOR_RUN(FILTER_TRANSCRIPTS.out.transcripts_filtered)
+        BAYSOR_RUN(ch_transcripts_filtered)
         
         // Combine baysor file channels for reconstruction 
         grouped_csvs = BAYSOR_RUN.out.csv.groupTuple(by: 0)
-        grouped_jsons = BAYSOR_RUN.out.json.groupTuple(by: 0)
-        merged_inputs = grouped_csvs.join(grouped_jsons, by: 0)
+        grouped_polygons = BAYSOR_RUN.out.polygons.groupTuple(by: 0)
+        merged_inputs = grouped_csvs.join(grouped_polygons, by: 0).join(ch_splits_csv, by: 0)
 
-        // Reconstruct segmentation files
+        // Reconstruct segmentation files (rows without polygons and polygons
+        // without transcripts are reconciled in the same task)
         RECONSTRUCT_SEGMENTATION(merged_inputs)
 
-        // Filter polygons to only include cells present in the CSV
-        FILTER_POLYGONS(RECONSTRUCT_SEGMENTATION.out.complete_segmentation)
-
 
     emit:
-    segmentation = FILTER_POLYGONS.out.filtered_segmentation
+    segmentation = RECONSTRUCT_SEGMENTATION.out.complete_segmentation
 
 
 }
@@ -124,8 +147,18 @@ workflow SEGGER_CREATE_TRAIN_PREDICT {
         return [ meta, transcript_file ]
     }
 
+    // Per-cell geometry is computed once and cached, so SEGGER_EXPLORER only applies the area thresholds
+    SEGGER_EXPLORER_GEOMETRY ( ch_segger_transcripts )
+
+    // Pair the transcripts, bundle and geometry of each sample by meta.id, so samples never get mixed up
+    ch_explorer_input = ch_segger_transcripts
+        .map { meta, transcripts -> [ meta.id, meta, transcripts ] }
+        .join ( ch_basedir.map { meta, basedir -> [ meta.id, basedir ] } )
+        .join ( SEGGER_EXPLORER_GEOMETRY.out.geometry.map { meta, geometry -> [ meta.id, geometry ] } )
+        .map { _id, meta, transcripts, basedir, geometry -> [ meta, transcripts, basedir, geometry ] }
+
     // Run SEGGER_EXPLORER to create Xenium Explorer compatible files
-    SEGGER_EXPLORER ( ch_segger_transcripts, ch_basedir )
+    SEGGER_EXPLORER ( ch_explorer_input )
     ch_versions = ch_versions.mix ( SEGGER_EXPLORER.out.versions )
 
     emit:
@@ -155,6 +188,10 @@ workflow {
     if (!params.runRanger && !params.runBaysor && !params.runSegger) {
         error "No method set. Please set either runRanger or runBaysor to true."
     }
+
+    if (params.runBaysor && !(params.baysor_tile_format in ['csv', 'parquet'])) {
+        error "baysor_tile_format must be 'csv' or 'parquet' (the formats Baysor can read). Got: ${params.baysor_tile_format}"
+    }
     
     // If Ranger is not running but Baysor is, force baysor_from_resegment to false
     def effective_baysor_from_resegment = params.baysor_from_resegment
@@ -203,27 +240,42 @@ workflow {
         ch_bundle_path_ranger = RESEGMENT_10X.out.bundle
     }
     
+    // The sorted cache only pays off for per-tile reads; with single-pass partitioning it is an extra full scan
+    def sort_transcripts = params.baysor_sort_transcripts && !params.baysor_single_pass
+
     if ( params.runBaysor ) {
         if (effective_baysor_from_resegment) {         
+            // Filtered, spatially sorted transcripts so splits and tile reads skip row groups
+            ch_transcripts_baysor = ch_transcripts_parquet_ranger
+            if (sort_transcripts) {
+                SORT_TRANSCRIPTS(ch_transcripts_parquet_ranger)
+                ch_transcripts_baysor = SORT_TRANSCRIPTS.out.sorted
+            }
             // Calculate splits for tiling transcript file
             if (!params.preset_splits) {
-                CALC_SPLITS(ch_transcripts_parquet_ranger)
+                CALC_SPLITS(ch_transcripts_baysor)
                 ch_splits = CALC_SPLITS.out.ch_splits_csv
             }
             //Baysor segmentation (using parallel processing workflow)
-            BAYSOR_PARALLEL(ch_transcripts_parquet_ranger, ch_splits)
+            BAYSOR_PARALLEL(ch_transcripts_baysor, ch_splits)
             
             //Importing baysor segmentation into new Xenium bundle
             IMPORT_SEGMENTATION(ch_bundle_path_ranger, BAYSOR_PARALLEL.out.segmentation)
         }
         else {
+            // Filtered, spatially sorted transcripts so splits and tile reads skip row groups
+            ch_transcripts_baysor = ch_transcripts_parquet
+            if (sort_transcripts) {
+                SORT_TRANSCRIPTS(ch_transcripts_parquet)
+                ch_transcripts_baysor = SORT_TRANSCRIPTS.out.sorted
+            }
             // Calculate splits for tiling transcript file
             if (!params.preset_splits) {
-                CALC_SPLITS(ch_transcripts_parquet)
+                CALC_SPLITS(ch_transcripts_baysor)
                 ch_splits = CALC_SPLITS.out.ch_splits_csv
             }
             //Baysor segmentation (using parallel processing workflow)
-            BAYSOR_PARALLEL(ch_transcripts_parquet, ch_splits)
+            BAYSOR_PARALLEL(ch_transcripts_baysor, ch_splits)
             
             //Importing baysor segmentation into new Xenium bundle
             IMPORT_SEGMENTATION(ch_bundle_path, BAYSOR_PARALLEL.out.segmentation)
@@ -12,30 +12,32 @@ process BAYSOR_RUN {
     memory "${params.baysorMem} GB"
 
     input:
-    tuple val(meta), val(tile_id), path(transcripts_csv)
+    tuple val(meta), val(tile_id), path(transcripts), val(row_count)
 
     output:
     tuple val(meta), path("${tile_id}_segmentation.csv"), emit: csv
-    tuple val(meta), path("${tile_id}_segmentation_polygons_2d.json"), emit: json
+    tuple val(meta), path("${tile_id}_segmentation_polygons.parquet"), emit: polygons
 
     script:
     """
     export JULIA_NUM_THREADS=$params.baysorCPUs
 
-    # Count the number of rows in the CSV file (excluding the header)
-    row_count=\$(tail -n +2 ${transcripts_csv} | wc -l)
-
     # Check if the transcript count is at least at specified minium
-    if [ "\$row_count" -ge $params.baysor_min_trans ]; then
-        echo "File ${transcripts_csv} has \$row_count rows. Running Baysor..."
+    # (row_count comes from the filter step's .count sidecar / manifest, so the tile is not scanned here)
+    if [ ${row_count} -ge $params.baysor_min_trans ]; then
+        echo "File ${transcripts} has ${row_count} rows. Running Baysor..."
         baysor run -x x_location -y y_location -z z_location -g feature_name \\
         -o ${tile_id}_segmentation.csv \\
         -m $params.baysor_m -p --prior-segmentation-confidence $params.baysor_prior --polygon-format "GeometryCollectionLegacy" \\
-        ${transcripts_csv} :cell_id
+        ${transcripts} :cell_id
     else
-        echo "File ${transcripts_csv} has fewer than ${params.baysor_min_trans} rows (\$row_count). Skipping Baysor run."
+        echo "File ${transcripts} has fewer than ${params.baysor_min_trans} rows (${row_count}). Skipping Baysor run."
         echo "transcript_id,cell_id,overlaps_nucleus,gene,x,y,z,qv,fov_name,nucleus_distance,codeword_index,codeword_category,is_gene,molecule_id,prior_segmentation,confidence,cluster,cell,assignment_confidence,is_noise,ncv_color" > ${tile_id}_segmentation.csv
         touch ${tile_id}_segmentation_polygons_2d.json
     fi
+
+    # Parse the polygon JSON once; later steps read the columnar GeoParquet
+    polygon_parquet.py ${tile_id}_segmentation_polygons_2d.json ${tile_id}_segmentation_polygons.parquet
+    rm -f ${tile_id}_segmentation_polygons_2d.json
     """
 }
\ No newline at end of file
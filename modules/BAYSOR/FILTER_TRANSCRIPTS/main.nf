@@ -14,17 +14,22 @@ process FILTER_TRANSCRIPTS {
     memory "${params.filterMem} GB"
     
     input:
-    tuple val(meta), path(transcripts_path), val(tile_id), val(x_min), val(x_max), val(y_min), val(y_max)
+    tuple val(meta), path(transcripts_path), val(tile_id), val(x_min), val(x_max), val(y_min), val(y_max), val(outer_x_max), val(outer_y_max)
     //tuple val(meta), path(resegmented_dir)
     //tuple val(tile_id), val(x_min), val(x_max), val(y_min), val(y_max) // Tuple from splits.csv
 
     output:
-    tuple val(meta), val(tile_id), path("*_filtered_transcripts.csv"), emit: transcripts_filtered
+    tuple val(meta), val(tile_id), path("*_filtered_transcripts.${params.baysor_tile_format}"), path("*_filtered_transcripts.count"), emit: transcripts_filtered
 
    script:
     """
     filter_transcripts_parquet_v4.py -transcript "${transcripts_path}" \\
       -min_x ${x_min} -max_x ${x_max} \\
-      -min_y ${y_min} -max_y ${y_max}
+      -min_y ${y_min} -max_y ${y_max} \\
+      -outer_x_max ${outer_x_max} -outer_y_max ${outer_y_max} \\
+      -min_qv ${params.baysor_min_qv} \\
+      -halo ${params.baysor_halo} \\
+      -exclude_prefixes "${params.baysor_exclude_prefixes}" \\
+      -format ${params.baysor_tile_format}
     """
  }
\ No newline at end of file
@@ -0,0 +1,32 @@
+#!/usr/bin/env nextflow
+
+/*
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    PARTITION_TRANSCRIPTS
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+*/
+
+// Single-pass alternative to FILTER_TRANSCRIPTS: reads transcripts.parquet once and writes every tile in splits.csv
+process PARTITION_TRANSCRIPTS {
+    tag "$meta.id"
+
+    cpus params.filterCPUs
+    memory "${params.filterMem} GB"
+
+    input:
+    tuple val(meta), path(transcripts_path), path(splits_csv)
+
+    output:
+    tuple val(meta), path("tiles_manifest.csv"), path("*_filtered_transcripts.${params.baysor_tile_format}"), emit: partitioned
+
+    script:
+    """
+    filter_transcripts_parquet_v4.py -transcript "${transcripts_path}" \\
+      -splits ${splits_csv} \\
+      -min_qv ${params.baysor_min_qv} \\
+      -halo ${params.baysor_halo} \\
+      -exclude_prefixes "${params.baysor_exclude_prefixes}" \\
+      -format ${params.baysor_tile_format} \\
+      -manifest tiles_manifest.csv
+    """
+}
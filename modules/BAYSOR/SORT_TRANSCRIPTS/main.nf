@@ -0,0 +1,31 @@
+#!/usr/bin/env nextflow
+
+/*
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    SORT_TRANSCRIPTS
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+*/
+
+// Filters transcripts.parquet once and rewrites it sorted along a Hilbert curve, so tile reads only touch overlapping row groups
+// The result is stored per bundle (keyed by sample, file size/mtime, curve, QV threshold and exclude prefixes) and reused across runs
+process SORT_TRANSCRIPTS {
+    tag "$meta.id"
+
+    cpus params.filterCPUs
+    memory "${params.filterMem} GB"
+    storeDir "${params.transcript_cache_dir}/${meta.id}/${transcripts_path.size()}_${transcripts_path.lastModified()}_${params.transcript_cache_curve}_qv${params.baysor_min_qv}_${Integer.toHexString(params.baysor_exclude_prefixes.hashCode())}"
+
+    input:
+    tuple val(meta), path(transcripts_path)
+
+    output:
+    tuple val(meta), path("sorted_transcripts.parquet"), emit: sorted
+
+    script:
+    """
+    sort_transcripts.py "${transcripts_path}" sorted_transcripts.parquet \\
+        --curve ${params.transcript_cache_curve} \\
+        --min_qv ${params.baysor_min_qv} \\
+        --exclude_prefixes "${params.baysor_exclude_prefixes}"
+    """
+}
@@ -6,7 +6,7 @@
 ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 */
 
-// Produces coordinates of quantile-based tiles to split transcripts file into for parallel baysor runs
+// Produces coordinates of quantile-based (grid) or density-balanced (kd) tiles to split transcripts file into for parallel baysor runs
 // TODO
 process CALC_SPLITS {
     tag "$meta.id"
@@ -18,8 +18,11 @@ process CALC_SPLITS {
     tuple val(meta), path("splits.csv"), emit: ch_splits_csv
 
     script:
+    def streaming = params.csplit_streaming ? "--streaming --quantile_error ${params.csplit_quantile_error}" : ''
     """
-    split_transcripts.py "${transcripts}" "splits.csv" --x_bins ${params.csplit_x_bins} --y_bins ${params.csplit_y_bins} 
+    split_transcripts.py "${transcripts}" "splits.csv" --x_bins ${params.csplit_x_bins} --y_bins ${params.csplit_y_bins} \\
+        --strategy ${params.csplit_strategy} --target_transcripts ${params.csplit_target_transcripts} ${streaming} \\
+        --min_qv ${params.baysor_min_qv} --exclude_prefixes "${params.baysor_exclude_prefixes}"
     """
 
 }
\ No newline at end of file
@@ -23,10 +23,13 @@ process IMPORT_SEGMENTATION {
 
     script:
     """
+    # The pipeline keeps polygons as GeoParquet; xeniumranger reads the GeometryCollection JSON
+    polygon_parquet.py ${polygons} viz_polygons.json
+
     xeniumranger import-segmentation --id="${params.id}_baysor" \
                                  --xenium-bundle=${xenium_bundle} \
                                  --transcript-assignment=${segmentation} \
-                                 --viz-polygons=${polygons} \
+                                 --viz-polygons=viz_polygons.json \
                                  --units=microns \
                                  --localcores=${params.rangerimportCPUs} \
                                  --localmem=${params.rangerimportMem}
@@ -24,6 +24,8 @@ process SEGGER_CREATE_DATASET {
     
     // Check if we should auto-detect or use manual value
     def detect_tokens = params.segger_num_tx_tokens == 0 || params.segger_num_tx_tokens == null
+    // Token statistics are cached next to the sorted transcripts, never inside the input bundle
+    def token_cache_dir = file("${params.transcript_cache_dir}/num_tokens")
 
     // check for platform values
     if ( !(params.format in ['xenium']) ) {
@@ -34,7 +36,7 @@ process SEGGER_CREATE_DATASET {
     # Detect or use provided num_tx_tokens
     if [ "${detect_tokens}" = "true" ]; then
         echo "Auto-detecting num_tx_tokens from Xenium bundle..."
-        NUM_TX_TOKENS=\$(detect_num_tokens.py ${base_dir} --buffer 10)
+        NUM_TX_TOKENS=\$(detect_num_tokens.py ${base_dir} --buffer 10 --cache-dir ${token_cache_dir})
         
         if [ -z "\$NUM_TX_TOKENS" ]; then
             echo "Warning: Could not detect tokens, using default 313"
@@ -14,13 +14,13 @@ process SEGGER_EXPLORER {
     memory "${params.seggerExplorerMem} GB"
 
     input:
-    tuple val(meta), path(seg_df_parquet)
-    tuple val(meta), path(source_path)
+    tuple val(meta), path(seg_df_parquet), path(source_path), path(geometry_cache)
 
     output:
     tuple val(meta), path("${meta.id}_xenium_explorer")                           , emit: explorer_dir
     tuple val(meta), path("${meta.id}_xenium_explorer/*.zarr.zip")               , emit: zarr_files
     tuple val(meta), path("${meta.id}_xenium_explorer/*.xenium")                 , emit: xenium_file
+    tuple val(meta), path("${meta.id}_xenium_explorer/cell_feature_matrix.*")    , emit: count_matrix, optional: true
     path("versions.yml")                                                          , emit: versions
 
     when:
@@ -40,6 +40,12 @@ process SEGGER_EXPLORER {
     def cell_id_column = task.ext.cell_id_column ?: "cell_id"
     def area_low = task.ext.area_low ?: 10
     def area_high = task.ext.area_high ?: 100
+    def streaming = task.ext.streaming ? "--streaming" : ''
+    def max_vertices = task.ext.max_vertices ?: 128
+    def chunk_cells = task.ext.chunk_cells ?: 32768
+    def compressor = task.ext.compressor ?: "zstd"
+    def build_dir = task.ext.build_dir ? "--build-dir ${task.ext.build_dir}" : ''
+    def count_matrix = task.ext.count_matrix ? "--count-matrix ${task.ext.count_matrix}" : ''
     def script_path = task.ext.script_path ?: "/workspace/segger_dev/src/segger/cli/seg2explorer.py"
 
     """
@@ -53,6 +59,15 @@ process SEGGER_EXPLORER {
         --cell-id-column ${cell_id_column} \\
         --area-low ${area_low} \\
         --area-high ${area_high} \\
+        --workers ${task.cpus} \\
+        ${streaming} \\
+        --max-vertices ${max_vertices} \\
+        --geometry-cache ${geometry_cache} \\
+        --chunk-cells ${chunk_cells} \\
+        --compressor ${compressor} \\
+        --compression-threads ${task.cpus} \\
+        ${build_dir} \\
+        ${count_matrix} \\
         --verbose \\
         ${args}
     
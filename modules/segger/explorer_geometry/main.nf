@@ -0,0 +1,53 @@
+#!/usr/bin/env nextflow
+
+/*
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    SEGGER EXPLORER GEOMETRY
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+*/
+
+// Computes the per-cell boundaries, nucleus hulls and summary stats once, before the area filter
+// The sidecar is stored per sample (keyed by the segmentation file size/mtime, the vertex budget and whether feature
+// counts are included), so SEGGER_EXPLORER runs with new area thresholds only refilter it and rewrite the zarr files
+process SEGGER_EXPLORER_GEOMETRY {
+    tag "$meta.id"
+    label 'process_medium'
+    cpus params.seggerExplorerCPUs
+    memory "${params.seggerExplorerMem} GB"
+    storeDir "${params.segger_explorer_geometry_cache_dir}/${meta.id}/${seg_df_parquet.size()}_${seg_df_parquet.lastModified()}_${params.segger_explorer_max_vertices}${params.segger_explorer_count_matrix ? '_features' : ''}"
+
+    input:
+    tuple val(meta), path(seg_df_parquet)
+
+    output:
+    tuple val(meta), path("cell_geometry.parquet"), emit: geometry
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    if (workflow.profile.tokenize(',').intersect(['conda', 'mamba']).size() >= 1) {
+        error "SEGGER_EXPLORER_GEOMETRY module does not support Conda. Please use Docker / Singularity / Podman instead."
+    }
+
+    def cell_id_column = task.ext.cell_id_column ?: "cell_id"
+    def max_vertices = task.ext.max_vertices ?: 128
+    def streaming = task.ext.streaming ? "--streaming" : ''
+    def feature_counts = task.ext.feature_counts ? "--feature-counts" : ''
+
+    """
+    segger_explorer_geometry.py \\
+        ${seg_df_parquet} \\
+        cell_geometry.parquet \\
+        --cell-id-column ${cell_id_column} \\
+        --max-vertices ${max_vertices} \\
+        --workers ${task.cpus} \\
+        ${streaming} \\
+        ${feature_counts}
+    """
+
+    stub:
+    """
+    touch cell_geometry.parquet
+    """
+}
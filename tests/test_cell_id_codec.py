@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from cell_id_codec import decode_xenium_ids, encode_xenium_ids
+
+ALPHABET = np.array(list('abcdefghijklmnop'))
+
+
+def reference_str_to_uint32(cell_id_str):
+    """The per-ID str_to_uint32 conversion the codec replaces."""
+    prefix, suffix = cell_id_str.split("-")
+    str_to_hex_mapping = dict(zip('abcdefghijklmnop', '0123456789abcdef'))
+    hex_prefix = "".join([str_to_hex_mapping[char] for char in prefix])
+    return int(hex_prefix, 16), int(suffix)
+
+
+def random_ids(rng, n, length=8):
+    letters = ALPHABET[rng.integers(0, 16, size=(n, length))]
+    suffixes = rng.integers(1, 100_000, size=n)
+    return [f"{''.join(row)}-{suffix}" for row, suffix in zip(letters, suffixes)]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_round_trip_matches_scalar_reference(seed):
+    rng = np.random.default_rng(seed)
+    ids = random_ids(rng, 2000) + ['aaaaaaaa-1', 'pppppppp-1', 'ffkpbaba-123456789']
+
+    prefixes, suffixes = encode_xenium_ids(ids)
+    assert prefixes.dtype == np.uint32
+    assert list(zip(prefixes.tolist(), suffixes.tolist())) == [reference_str_to_uint32(i) for i in ids]
+    assert decode_xenium_ids(prefixes, suffixes).tolist() == ids
+
+
+def test_short_prefixes_match_scalar_reference():
+    rng = np.random.default_rng(0)
+    ids = [i for length in range(1, 8) for i in random_ids(rng, 50, length)]
+    prefixes, suffixes = encode_xenium_ids(np.array(ids, dtype=object))
+    assert list(zip(prefixes.tolist(), suffixes.tolist())) == [reference_str_to_uint32(i) for i in ids]
+
+
+def test_decode_pads_to_eight_letters():
+    prefixes, suffixes = encode_xenium_ids(['bc-2'])
+    assert decode_xenium_ids(prefixes, suffixes).tolist() == ['aaaaaabc-2']
+
+
+def test_empty_input():
+    prefixes, suffixes = encode_xenium_ids([])
+    assert len(prefixes) == len(suffixes) == 0
+    assert len(decode_xenium_ids(prefixes, suffixes)) == 0
+
+
+@pytest.mark.parametrize('cell_id', [
+    'ffkpbaba',         # no dash
+    'ffkp-baba-1',      # two dashes
+    '-1',               # empty prefix
+    'ffkpbaba-',        # empty suffix
+    'ffkpbabaq-1',      # 9 letters do not fit a uint32
+    'ffkpbabz-1',       # letter outside a-p
+    'FFKPBABA-1',       # upper case
+    'ffkpbaba-x1',      # non-numeric suffix
+])
+def test_malformed_ids_are_rejected(cell_id):
+    with pytest.raises(ValueError):
+        encode_xenium_ids(['aaaaaaaa-1', cell_id])
@@ -0,0 +1,106 @@
+import argparse
+import pyarrow as pa
+import pyarrow.csv as pcsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+from filter_transcripts_parquet_v4 import filter_tile, partition_tiles
+
+# Two tiles side by side, sharing the edge x = 10
+TILES = [
+    {'tile_id': 'left', 'x_min': 0.0, 'x_max': 10.0, 'y_min': 0.0, 'y_max': 10.0},
+    {'tile_id': 'right', 'x_min': 10.0, 'x_max': 20.0, 'y_min': 0.0, 'y_max': 10.0},
+]
+
+
+@pytest.fixture
+def transcripts(tmp_path):
+    path = tmp_path / 'transcripts.parquet'
+    table = pa.table({
+        'transcript_id': pa.array([1, 2, 3, 4], pa.int64()),
+        'cell_id': pa.array(['a', 'b', 'c', 'd']),
+        'feature_name': pa.array(['G1', 'G2', 'G1', 'G2']).dictionary_encode(),
+        'x_location': pa.array([5.0, 10.0, 15.0, 20.0]),
+        'y_location': pa.array([5.0, 5.0, 5.0, 10.0]),
+        'qv': pa.array([30.0, 30.0, 30.0, 30.0]),
+    })
+    pq.write_table(table, path)
+    parquet_format = ds.ParquetFileFormat(read_options=ds.ParquetReadOptions(dictionary_columns=['feature_name']))
+    return ds.dataset(str(path), format=parquet_format)
+
+
+def args_for(**kwargs):
+    defaults = dict(min_qv=20.0, exclude_prefixes=[], halo=2.0, format='csv',
+                    outer_x_max=None, outer_y_max=None)
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
+
+
+def core_counts(paths):
+    """Number of tiles in which each transcript_id is core."""
+    counts = {}
+    for path in paths:
+        table = pcsv.read_csv(path)
+        for transcript_id, is_core in zip(table['transcript_id'].to_pylist(), table['is_core'].to_pylist()):
+            counts[transcript_id] = counts.get(transcript_id, 0) + is_core
+    return counts
+
+
+def test_shared_edge_is_core_in_one_tile_per_tile_mode(transcripts, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    paths = []
+    for tile in TILES:
+        filter_tile(transcripts, args_for(min_x=tile['x_min'], max_x=tile['x_max'],
+                                          min_y=tile['y_min'], max_y=tile['y_max'],
+                                          outer_x_max=20.0, outer_y_max=10.0))
+        paths.append(f"X{tile['x_min']}-{tile['x_max']}_Y{tile['y_min']}-{tile['y_max']}_filtered_transcripts.csv")
+
+    counts = core_counts(paths)
+    # The shared edge (x = 10) is core once; the outer corner (20, 10) is kept as core
+    assert counts == {1: 1, 2: 1, 3: 1, 4: 1}
+
+
+def test_per_tile_mode_matches_single_pass(transcripts, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    splits = tmp_path / 'splits.csv'
+    splits.write_text('tile_id,x_min,x_max,y_min,y_max\n' +
+                      ''.join(f"{t['tile_id']},{t['x_min']},{t['x_max']},{t['y_min']},{t['y_max']}\n" for t in TILES))
+    partition_tiles(transcripts, args_for(splits=str(splits), manifest='tiles_manifest.csv'))
+    single_pass = core_counts([f"{t['tile_id']}_filtered_transcripts.csv" for t in TILES])
+
+    per_tile = []
+    for tile in TILES:
+        filter_tile(transcripts, args_for(min_x=tile['x_min'], max_x=tile['x_max'],
+                                          min_y=tile['y_min'], max_y=tile['y_max'],
+                                          outer_x_max=20.0, outer_y_max=10.0))
+        per_tile.append(f"X{tile['x_min']}-{tile['x_max']}_Y{tile['y_min']}-{tile['y_max']}_filtered_transcripts.csv")
+
+    assert core_counts(per_tile) == single_pass
+
+
+def test_tile_csv_is_unquoted(transcripts, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    filter_tile(transcripts, args_for(min_x=0.0, max_x=20.0, min_y=0.0, max_y=10.0, halo=0.0))
+
+    lines = (tmp_path / 'X0.0-20.0_Y0.0-10.0_filtered_transcripts.csv').read_text().splitlines()
+    assert lines[0] == 'transcript_id,cell_id,feature_name,x_location,y_location,qv'
+    assert lines[1] == '1,a,G1,5,5,30'
+    assert '"' not in ''.join(lines)
+
+
+def test_tile_csv_quotes_only_when_needed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / 'transcripts.parquet'
+    pq.write_table(pa.table({
+        'cell_id': pa.array(['a']),
+        'feature_name': pa.array(['G1,x']).dictionary_encode(),
+        'x_location': pa.array([1.0]),
+        'y_location': pa.array([1.0]),
+        'qv': pa.array([30.0]),
+    }), path)
+    parquet_format = ds.ParquetFileFormat(read_options=ds.ParquetReadOptions(dictionary_columns=['feature_name']))
+    filter_tile(ds.dataset(str(path), format=parquet_format),
+                args_for(min_x=0.0, max_x=2.0, min_y=0.0, max_y=2.0, halo=0.0))
+
+    table = pcsv.read_csv(tmp_path / 'X0.0-2.0_Y0.0-2.0_filtered_transcripts.csv')
+    assert table['feature_name'].to_pylist() == ['G1,x']
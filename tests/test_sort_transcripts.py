@@ -0,0 +1,52 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+
+import sort_transcripts as st
+
+
+@pytest.fixture
+def skewed(tmp_path):
+    """Transcripts packed into one corner of the slide, so one top-level bucket gets nearly all rows."""
+    rng = np.random.default_rng(0)
+    n = 2000
+    x = np.concatenate([rng.uniform(0, 10, n - 4), [0, 1000, 0, 1000]])
+    y = np.concatenate([rng.uniform(0, 10, n - 4), [0, 0, 1000, 1000]])
+    table = pa.table({
+        'transcript_id': np.arange(n, dtype=np.uint64),
+        'feature_name': pa.array(['G1'] * n).dictionary_encode(),
+        'x_location': x,
+        'y_location': y,
+        'qv': np.full(n, 30.0),
+    })
+    path = tmp_path / 'transcripts.parquet'
+    pq.write_table(table, path)
+    return path
+
+
+def sort_with(path, tmp_path, bucket_bits, max_rows):
+    bounds = st.slide_bounds(pq.ParquetFile(path))
+    spill_dir = tmp_path / f'spill_{bucket_bits}_{max_rows}'
+    spill_dir.mkdir()
+    scanner = ds.dataset(path).scanner(batch_size=256)
+    paths, rows = st.spill_buckets(scanner, bounds, bucket_bits, str(spill_dir))
+    output = tmp_path / f'sorted_{bucket_bits}_{max_rows}.parquet'
+    st.write_sorted(paths, str(output), 2 * st.CURVE_ORDER - bucket_bits, max_rows=max_rows)
+    assert not list(spill_dir.iterdir())
+    return pq.read_table(output), rows
+
+
+def test_overfull_buckets_are_split(skewed, tmp_path, monkeypatch):
+    reference, rows = sort_with(skewed, tmp_path, 0, 10 ** 9)
+    assert rows == reference.num_rows == 2000
+
+    sorted_sizes = []
+    sort_indices = st.pc.sort_indices
+    monkeypatch.setattr(st.pc, 'sort_indices', lambda keys: sorted_sizes.append(len(keys)) or sort_indices(keys))
+    split, _ = sort_with(skewed, tmp_path, 2, 300)
+
+    assert split.column('transcript_id').to_pylist() == reference.column('transcript_id').to_pylist()
+    assert sum(sorted_sizes) == 2000
+    assert max(sorted_sizes) <= 300
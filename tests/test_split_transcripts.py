@@ -0,0 +1,65 @@
+import sys
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import split_transcripts
+from split_transcripts import NoTranscriptsError, load_coordinates, stream_density_grid, stream_quantile_ranges
+
+
+def write_transcripts(path):
+    pq.write_table(pa.table({
+        'x_location': pa.array([1.0, 2.0, 3.0, 4.0, 5.0]),
+        'y_location': pa.array([1.0, 2.0, 3.0, 4.0, 5.0]),
+        'feature_name': pa.array(['G1', 'G2', 'BLANK_0001', 'G1', 'NegControlProbe_A']),
+        'qv': pa.array([30.0, 10.0, 30.0, 25.0, 30.0]),
+    }), path)
+
+
+def test_density_grid_counts_only_filtered_transcripts(tmp_path):
+    path = tmp_path / 'transcripts.parquet'
+    write_transcripts(path)
+
+    x, y, counts, bounds = stream_density_grid(str(path), 4, 20.0, ['BLANK_', 'NegControlProbe_'])
+
+    # Low-QV (2) and control (3, 5) transcripts are not counted and do not widen the bounds
+    assert counts.sum() == 2
+    assert bounds == (1.0, 4.0, 1.0, 4.0)
+
+
+def test_load_coordinates_applies_the_same_filter(tmp_path):
+    path = tmp_path / 'transcripts.parquet'
+    write_transcripts(path)
+
+    df = load_coordinates(str(path), 20.0, ['BLANK_', 'NegControlProbe_'])
+
+    np.testing.assert_array_equal(df['x_location'].to_numpy(), [1.0, 4.0])
+
+
+@pytest.mark.parametrize('compute', [
+    lambda path: stream_density_grid(path, 4, 40.0, []),
+    lambda path: stream_quantile_ranges(path, 2, 2, 0.01, 40.0, []),
+    lambda path: load_coordinates(path, 40.0, []),
+])
+def test_no_transcripts_after_filtering_raises(tmp_path, compute):
+    path = tmp_path / 'transcripts.parquet'
+    write_transcripts(path)
+
+    with pytest.raises(NoTranscriptsError, match='No transcripts left'):
+        compute(str(path))
+
+
+@pytest.mark.parametrize('options', [['--strategy', 'kd'], ['--strategy', 'kd', '--streaming'], ['--streaming'], []])
+def test_cli_exits_with_error_when_filters_remove_everything(tmp_path, monkeypatch, capsys, options):
+    path = tmp_path / 'transcripts.parquet'
+    write_transcripts(path)
+    output = tmp_path / 'splits.csv'
+    monkeypatch.setattr(sys, 'argv', ['split_transcripts.py', str(path), str(output), '--min_qv', '40'] + options)
+
+    with pytest.raises(SystemExit) as exit_info:
+        split_transcripts.main()
+    assert exit_info.value.code == 1
+    assert 'No transcripts left' in capsys.readouterr().err
+    assert not output.exists()
@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from trim_tile_halos import resolve_ownership, trim_csv
+
+# Two tiles sharing the edge x = 10
+TILES = [
+    {'x_min': 0.0, 'x_max': 10.0, 'y_min': 0.0, 'y_max': 10.0},
+    {'x_min': 10.0, 'x_max': 20.0, 'y_min': 0.0, 'y_max': 10.0},
+]
+OUTER = {'x_max': 20.0, 'y_max': 10.0}
+
+
+def write_tile(path, rows):
+    """rows: (transcript_id, cell, x, y, is_core) tuples of one tile."""
+    pd.DataFrame(rows, columns=['transcript_id', 'cell', 'x', 'y', 'is_core']).to_csv(path, index=False)
+    return str(path)
+
+
+def trim(tmp_path, tile_rows):
+    paths = [write_tile(tmp_path / f'{i}_segmentation.csv', rows) for i, rows in enumerate(tile_rows)]
+    owned, claims = resolve_ownership(paths, TILES, OUTER)
+    trimmed = []
+    for tile_idx, path in enumerate(paths):
+        output = tmp_path / f'trimmed_{tile_idx}.csv'
+        trim_csv(path, output, owned[tile_idx], claims, tile_idx)
+        trimmed.append(pd.read_csv(output, dtype=str, keep_default_na=False))
+    return owned, trimmed
+
+
+def test_cell_split_evenly_has_one_owner(tmp_path):
+    # Both tiles segment the same cell from four transcripts, two on each side of x = 10
+    tile_0 = [(1, 'A-1', 8, 5, 1), (2, 'A-1', 9, 5, 1), (3, 'A-1', 11, 5, 0), (4, 'A-1', 12, 5, 0)]
+    tile_1 = [(1, 'B-1', 8, 5, 0), (2, 'B-1', 9, 5, 0), (3, 'B-1', 11, 5, 1), (4, 'B-1', 12, 5, 1)]
+    owned, trimmed = trim(tmp_path, [tile_0, tile_1])
+
+    # The centroid (x = 10) lies on the half-open edge, i.e. in the core of tile 1 only
+    assert owned == [set(), {'B-1'}]
+    rows = pd.concat(trimmed)
+    assert sorted(rows['transcript_id'].astype(int)) == [1, 2, 3, 4]
+    assert set(rows['cell']) == {'B-1'}
+
+
+def test_halo_claim_never_takes_core_rows_of_owned_cell(tmp_path):
+    # Tile 0 owns A-1, whose halo reaches transcript 3; in tile 1 that is a core row of its owned B-2
+    tile_0 = [(1, 'A-1', 8, 5, 1), (2, 'A-1', 9, 5, 1), (3, 'A-1', 11, 5, 0)]
+    tile_1 = [(3, 'B-2', 11, 5, 1), (4, 'B-2', 12, 5, 1), (5, 'B-2', 13, 5, 1)]
+    owned, trimmed = trim(tmp_path, [tile_0, tile_1])
+
+    assert owned == [{'A-1'}, {'B-2'}]
+    assert trimmed[0]['transcript_id'].tolist() == ['1', '2']
+    assert trimmed[1]['transcript_id'].tolist() == ['3', '4', '5']
+    assert set(trimmed[1]['cell']) == {'B-2'}
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_unowned_core_row_goes_to_lowest_claiming_tile(tmp_path, reverse):
+    # Transcript 9 is core in the middle tile, unassigned there, and in the halo of owned cells on both sides
+    tiles = [
+        {'x_min': 0.0, 'x_max': 10.0, 'y_min': 0.0, 'y_max': 10.0},
+        {'x_min': 10.0, 'x_max': 20.0, 'y_min': 0.0, 'y_max': 10.0},
+        {'x_min': 20.0, 'x_max': 30.0, 'y_min': 0.0, 'y_max': 10.0},
+    ]
+    rows = [
+        [(1, 'A-1', 2, 5, 1), (2, 'A-1', 3, 5, 1), (9, 'A-1', 15, 5, 0)],
+        [(9, '', 15, 5, 1)],
+        [(3, 'C-1', 27, 5, 1), (4, 'C-1', 28, 5, 1), (9, 'C-1', 15, 5, 0)],
+    ]
+    order = [2, 1, 0] if reverse else [0, 1, 2]
+    paths = [write_tile(tmp_path / f'{i}_segmentation.csv', rows[i]) for i in order]
+    _, claims = resolve_ownership(paths, [tiles[i] for i in order], {'x_max': 30.0, 'y_max': 10.0})
+    assert claims == {'9': 0}